@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import artifact
+import engine
+from cache import CachedEngine, Quantizer, WorkerStore
+from lut import BOOLEAN_FIELDS, LookupEngine
+from parity import TOLERANCES, breakpoints, legacy_evaluate_disease_fuzzy
+
+# ==========================================
+# ACCURACY / REGRESSION HARNESS AT SCALE
+# ==========================================
+# parity.py checks a few hundred patients against the frozen original
+# implementation; this harness checks millions. Seeded random patients cover
+# all nine universes, and a share of their inputs sit exactly on (or one ulp
+# either side of) a trapezoid breakpoint or a universe bound, where a
+# faster engine is most likely to round differently. Booleans are 0/1, as
+# the frontend sends them, except on CONTINUOUS_SHARE of the patients; only
+# 0/1 rows take the lookup table's grid path (the rest fall back to the
+# exact engine), so the report counts them and fails if fewer than
+# MIN_GRID_SHARE of the rows reached the grid.
+#
+# The original engine runs ~1000 patients/sec, far too slow for millions,
+# so the check is a chain:
+#
+#   legacy  == pyit2fls           on --anchor-rows patients (exact; shipped
+#                                 rule base only, the original hard-codes it)
+#   pyit2fls ~= numpy             on the same patients (NUMPY_TOLERANCE)
+#   numpy   ~= every other engine on all --rows patients (TOLERANCES)
+#
+# "Every other engine" is the analytic and lookup-table backends, an
+# analytic artifact round-tripped through artifact.py, and the result cache
+# (analytic behind a CachedEngine, the first CACHE_ROWS of every chunk scored
+# twice so the second pass is all hits). The lookup table is built once, into
+# a temporary directory, and loaded by every worker. Chunks run in parallel
+# on a process pool; per engine it reports the max / mean |crisp_score|
+# deviation and label flips, and exits 1 when a deviation exceeds the
+# engine's tolerance, a label flips for a patient whose reference score is
+# not within that tolerance of a label boundary, or an engine could not be
+# checked at all (e.g. the lookup table's startup guard refused it). Leave
+# an engine out on purpose with --skip.
+#
+#   python accuracy.py                           # 1M patients
+#   python accuracy.py --skip lut,cache          # everything else
+#   python accuracy.py --rows 5000000 --tolerance analytic=2e-3 --output accuracy.json
+
+DEFAULT_SEED = 20240
+DEFAULT_ROWS = 1_000_000
+ANCHOR_ROWS = 2000
+CHUNK_SIZE = 50_000
+CACHE_ROWS = 5000           # per chunk, scored twice through the result cache
+ANCHOR_CHUNK = 2 ** 32 - 1  # seeds the anchor patients apart from every chunk
+BOUNDARY_SHARE = 0.25       # fraction of inputs placed on a breakpoint
+CONTINUOUS_SHARE = 0.1      # fraction of patients whose booleans are not rounded to 0/1
+MIN_GRID_SHARE = 0.8        # fraction of rows the lookup table must score from its grid
+MAX_EXAMPLES = 5
+
+REFERENCE = "numpy"
+ENGINES = ("analytic", "lut", "artifact", "cache")
+
+
+def generate(rulebase, rows, seed, chunk, boundary_share=BOUNDARY_SHARE):
+    """Deterministic (rows, 9) patients for one chunk: uniform inputs, some moved onto breakpoints."""
+    rng = np.random.default_rng([seed, chunk])
+    bounds = np.array([rulebase.universes[var] for _, var in rulebase.inputs], dtype=float)
+    patients = bounds[:, 0] + rng.random((rows, len(engine.FIELDS))) * (bounds[:, 1] - bounds[:, 0])
+    for column, points in enumerate(breakpoints(rulebase)):
+        on_edge = rng.random(rows) < boundary_share
+        patients[on_edge, column] = rng.choice(points, on_edge.sum())
+    # booleans are sent as 0/1 by the frontend
+    booleans = [engine.FIELDS.index(field) for field in BOOLEAN_FIELDS]
+    rounded = np.flatnonzero(rng.random(rows) >= CONTINUOUS_SHARE)
+    patients[np.ix_(rounded, booleans)] = np.round(patients[np.ix_(rounded, booleans)])
+    return patients
+
+
+class Deviation:
+    """Running max / mean deviation and label flips of one engine against the reference."""
+
+    def __init__(self, name, tolerance, min_grid_share=None):
+        self.name = name
+        self.tolerance = tolerance
+        self.min_grid_share = min_grid_share
+        self.skipped = None
+        self.rows = self.flips = self.excused = self.on_grid = 0
+        self.total = self.max = 0.0
+        self.worst = None
+        self.failures = []
+
+    def add(self, rulebase, patients, expected, got, on_grid=0):
+        (ref_scores, ref_labels), (scores, labels) = expected, got
+        ref_scores, scores = np.asarray(ref_scores, dtype=float), np.asarray(scores, dtype=float)
+        deviation = np.abs(scores - ref_scores)
+        flipped = np.asarray(ref_labels, dtype=object) != np.asarray(labels, dtype=object)
+        boundaries = np.array([lower for lower, _ in rulebase.labels[1:]], dtype=float)
+        near = (np.abs(ref_scores[:, None] - boundaries) <= self.tolerance).any(axis=1)
+
+        self.rows += len(patients)
+        self.on_grid += on_grid
+        self.total += float(deviation.sum())
+        self.flips += int(flipped.sum())
+        self.excused += int((flipped & near).sum())
+        if len(deviation) and deviation.max() > self.max:
+            i = int(deviation.argmax())
+            self.max = float(deviation[i])
+            self.worst = self._example(patients, i, expected, got)
+        for i in np.flatnonzero((deviation > self.tolerance) | (flipped & ~near))[:MAX_EXAMPLES - len(self.failures)]:
+            self.failures.append(self._example(patients, i, expected, got))
+
+    @staticmethod
+    def _example(patients, i, expected, got):
+        return {"inputs": dict(zip(engine.FIELDS, patients[i].tolist())),
+                "expected": [float(expected[0][i]), expected[1][i]], "got": [float(got[0][i]), got[1][i]]}
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.on_grid += other.on_grid
+        self.total += other.total
+        self.flips += other.flips
+        self.excused += other.excused
+        if other.worst is not None and (self.worst is None or other.max > self.max):
+            self.max, self.worst = other.max, other.worst
+        self.failures = (self.failures + other.failures)[:MAX_EXAMPLES]
+
+    @property
+    def failed(self):
+        # an engine that was not (or could not be) compared has not passed
+        if self.skipped or not self.rows:
+            return True
+        short = self.min_grid_share is not None and self.on_grid < self.min_grid_share * self.rows
+        return self.max > self.tolerance or self.flips > self.excused or short
+
+    def report(self):
+        report = {"rows": self.rows, "tolerance": self.tolerance, "max_deviation": self.max,
+                  "mean_deviation": self.total / self.rows if self.rows else 0.0,
+                  "label_flips": self.flips, "flips_at_boundary": self.excused,
+                  "passed": not self.failed, "worst": self.worst, "failures": self.failures}
+        if self.min_grid_share is not None:
+            report["rows_on_grid"] = self.on_grid
+        if self.skipped:
+            report["skipped"] = self.skipped
+        return report
+
+
+# ---------- pool workers ----------
+_state = {}
+
+
+def _init_worker(spec, checked, artifact_path, lut_path, tolerances):
+    rulebase = engine.RuleBase(spec)
+    reference = engine.build_engine(REFERENCE, rulebase)
+    analytic = engine.build_engine("analytic", rulebase)
+    engines = {}
+    if "analytic" in checked:
+        engines["analytic"] = analytic
+    if lut_path:
+        # built by the parent: never the serving cache at FUZZY_LUT_PATH
+        engines["lut"] = LookupEngine.load(lut_path, analytic)
+    if artifact_path:
+        engines["artifact"] = artifact.load_artifact(artifact_path)
+    _state.update(rulebase=rulebase, tolerances=tolerances, reference=reference, engines=engines,
+                  cache_inner=analytic if "cache" in checked else None)
+
+
+def _run_chunk(seed, chunk, rows, boundary_share):
+    rulebase, tolerances = _state["rulebase"], _state["tolerances"]
+    patients = generate(rulebase, rows, seed, chunk, boundary_share)
+    expected = _state["reference"].evaluate_batch(patients)
+    results = {}
+    for name, compiled in _state["engines"].items():
+        results[name] = Deviation(name, tolerances[name])
+        on_grid = int(compiled.covered(patients).sum()) if name == "lut" else 0
+        results[name].add(rulebase, patients, expected, compiled.evaluate_batch(patients), on_grid)
+    if _state["cache_inner"] is None:
+        return results
+    # the cache only has to hand back what it stored: a slice of each chunk is enough
+    sample = slice(0, CACHE_ROWS)
+    cached = CachedEngine(_state["cache_inner"], WorkerStore(CACHE_ROWS), Quantizer({}))
+    cached.evaluate_batch(patients[sample])
+    results["cache"] = Deviation("cache", tolerances["cache"])
+    results["cache"].add(rulebase, patients[sample], (expected[0][sample], expected[1][sample]),
+                         cached.evaluate_batch(patients[sample]))
+    return results
+
+
+def _run_anchor(seed, rows, boundary_share, legacy):
+    """`rows` patients through pyit2fls and the reference (and the original engine when `legacy`)."""
+    rulebase, tolerances = _state["rulebase"], _state["tolerances"]
+    patients = generate(rulebase, rows, seed, ANCHOR_CHUNK, boundary_share)
+    with warnings.catch_warnings():
+        # pyit2fls warns on the 0/0 centroid of patients no rule fires for
+        warnings.simplefilter("ignore", RuntimeWarning)
+        exact = engine.build_engine("pyit2fls", rulebase).evaluate_batch(patients)
+        if legacy:
+            original = [legacy_evaluate_disease_fuzzy(*row) for row in patients.tolist()]
+    results = {REFERENCE: Deviation(REFERENCE, tolerances[REFERENCE])}
+    results[REFERENCE].add(rulebase, patients, exact, _state["reference"].evaluate_batch(patients))
+    if legacy:
+        results["pyit2fls"] = Deviation("pyit2fls", tolerances["pyit2fls"])
+        results["pyit2fls"].add(rulebase, patients, ([s for s, _ in original], [l for _, l in original]), exact)
+    return results
+
+
+def run(rulebase, rows=DEFAULT_ROWS, anchor_rows=ANCHOR_ROWS, seed=DEFAULT_SEED, workers=None,
+        chunk_size=CHUNK_SIZE, boundary_share=BOUNDARY_SHARE, tolerances=None, skip=()):
+    """Run the whole chain, leaving out the ENGINES in `skip`; returns {engine: Deviation} in report order."""
+    if rows < 1 or anchor_rows < 1:
+        raise ValueError("Every engine must be compared on at least one patient (rows and anchor rows >= 1)")
+    tolerances = dict(TOLERANCES, artifact=TOLERANCES["analytic"], cache=TOLERANCES["analytic"]) | (tolerances or {})
+    # the original engine hard-codes the shipped rule base: only comparable to that one
+    legacy = rulebase.fingerprint == engine.load_rulebase(engine.DEFAULT_RULEBASE).fingerprint
+    checked = tuple(name for name in ENGINES if name not in skip)
+    totals = {name: Deviation(name, tolerances[name], MIN_GRID_SHARE if name == "lut" else None)
+              for name in (("pyit2fls",) if legacy else ()) + (REFERENCE,) + checked}
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_path = lut_path = None
+        if "artifact" in checked:
+            artifact_path = os.path.join(tmp, "accuracy.bin")
+            artifact.compile_artifact(artifact_path, "analytic", rulebase)
+        if "lut" in checked:
+            lut_path = os.path.join(tmp, "accuracy_lut.npz")
+            try:
+                LookupEngine.load_or_build(rulebase, path=lut_path)
+            except ValueError as e:
+                # the startup guard would refuse this table, so no deployment could serve it
+                totals["lut"].skipped = str(e)
+                lut_path = None
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(rulebase.spec(), checked, artifact_path, lut_path, tolerances)) as pool:
+            # the slow anchor goes first so it overlaps with the chunks
+            futures = [pool.submit(_run_anchor, seed, anchor_rows, boundary_share, legacy)]
+            for chunk, start in enumerate(range(0, rows, chunk_size)):
+                futures.append(pool.submit(_run_chunk, seed, chunk, min(chunk_size, rows - start), boundary_share))
+            for future in futures:
+                for name, deviation in future.result().items():
+                    totals[name].merge(deviation)
+    return totals
+
+
+def _tolerances(spec):
+    """'lut=2e-3,analytic=2e-3' -> {engine: tolerance}."""
+    tolerances = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, _, value = part.partition("=")
+        if name not in ("pyit2fls", REFERENCE) + ENGINES:
+            raise ValueError(f"Unknown engine {name!r} in --tolerance; choose from {['pyit2fls', REFERENCE, *ENGINES]}")
+        tolerances[name] = float(value)
+    return tolerances
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every engine backend against the reference at scale")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="patients per engine (default: 1000000)")
+    parser.add_argument("--anchor-rows", type=int, default=ANCHOR_ROWS,
+                        help="patients also run through the original engine and pyit2fls (default: 2000)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="patients per work unit")
+    parser.add_argument("--boundary-share", type=float, default=BOUNDARY_SHARE,
+                        help="fraction of inputs placed on a breakpoint (default: 0.25)")
+    parser.add_argument("--tolerance", help="max |crisp_score| deviation overrides, e.g. lut=2e-3,analytic=2e-3")
+    parser.add_argument("--skip", help=f"comma-separated engines to leave out, from {', '.join(ENGINES)}")
+    parser.add_argument("--rulebase", help="rule-base spec (default: $FUZZY_RULEBASE or rulebase.json)")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+    if args.rows < 1 or args.anchor_rows < 1:
+        parser.error("--rows and --anchor-rows must be at least 1")
+    skip = [name.strip() for name in (args.skip or "").split(",") if name.strip()]
+    if any(name not in ENGINES for name in skip):
+        parser.error(f"--skip takes engines from {list(ENGINES)}, got {skip}")
+    try:
+        tolerances = _tolerances(args.tolerance)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rulebase = engine.load_rulebase(args.rulebase) if args.rulebase else engine.load_rulebase()
+    started = time.perf_counter()
+    totals = run(rulebase, args.rows, args.anchor_rows, args.seed, args.workers, args.chunk_size,
+                 args.boundary_share, tolerances, skip)
+    elapsed = time.perf_counter() - started
+
+    print(f"{'engine':>10} {'reference':>10} {'rows':>10} {'max dev':>10} {'mean dev':>10} {'tolerance':>10} "
+          f"{'flips':>7} {'boundary':>8} {'on grid':>10}")
+    for name, deviation in totals.items():
+        against = "legacy" if name == "pyit2fls" else "pyit2fls" if name == REFERENCE else REFERENCE
+        result = deviation.report()
+        if deviation.skipped:
+            print(f"{name:>10} {against:>10} not checked: {deviation.skipped}  FAIL")
+            continue
+        print(f"{name:>10} {against:>10} {result['rows']:>10} {result['max_deviation']:>10.3g} "
+              f"{result['mean_deviation']:>10.3g} {result['tolerance']:>10.3g} {result['label_flips']:>7} "
+              f"{result['flips_at_boundary']:>8} {result.get('rows_on_grid', '-'):>10}  "
+              f"{'ok' if result['passed'] else 'FAIL'}")
+        for failure in result["failures"]:
+            print(f"{'':>10} MISMATCH {failure['inputs']}: expected {failure['expected']}, got {failure['got']}")
+    if "pyit2fls" not in totals:
+        print(f"{'pyit2fls':>10} {'legacy':>10} not compared: the original engine hard-codes the shipped rule base")
+    for name in skip:
+        print(f"{name:>10} {REFERENCE:>10} skipped (--skip)")
+    print(f"{args.rows} patients in {elapsed:.1f}s (seed {args.seed})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": args.rows, "seed": args.seed, "seconds": elapsed, "skipped": skip,
+                       "engines": {name: deviation.report() for name, deviation in totals.items()}}, f, indent=2)
+    return 1 if any(deviation.failed for deviation in totals.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,132 +1,53 @@
-from flask import Flask, request, jsonify, render_template_string
-from pyit2fls import trapezoid_mf, T1FS, T1Mamdani
-from numpy import linspace
-import numpy as np
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+import functools
+import json
+import os
+import sys
+import time
 import traceback
 
+if __name__ == '__main__':
+    # serve as an imported module (before building anything): the spawned
+    # report renderers would otherwise re-execute this script, engine and all
+    os.execv(sys.executable, [sys.executable, "-m", "flask", "--app", os.path.abspath(__file__), "run", "--debug",
+                              "--port", "5000"])
+
+import engine
+import frontend
+import metrics
+import monitor
+import registry
+import reports
+from batch import iter_records, score_records
+from cache import CachedEngine, cached
+from schema import ValidationError, schema_for
+from sweep import sweep
+
 app = Flask(__name__)
 
-# ==========================================
-# PHASE 1: THE MATHEMATICAL ENGINE (BACKEND)
-# ==========================================
-def evaluate_disease_fuzzy(fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
-    # 1. Universes of Discourse (Fixed Medical Data)
-    d_fever = linspace(98, 104, 500)
-    d_headache = linspace(0, 10, 500)
-    d_rrate = linspace(10, 40, 500) 
-    d_cough = linspace(0, 10, 500)
-    d_sthroat = linspace(0, 1, 500)
-    d_flu = linspace(0, 1, 500)
-    d_vomit = linspace(0, 1, 500)
-    d_diarr = linspace(0, 1, 500)
-    d_oxygen = linspace(70, 100, 500) 
-    d_disease = linspace(0, 100, 500)
-
-    # 2. Fuzzy Sets
-    Fever_low = T1FS(d_fever, trapezoid_mf, [97.9, 98, 98.5, 99, 1])
-    Fever_med = T1FS(d_fever, trapezoid_mf, [98.5, 99, 101.5, 102, 1])
-    Fever_high = T1FS(d_fever, trapezoid_mf, [101.5, 102, 104, 104.1, 1])
-
-    Headache_mod = T1FS(d_headache, trapezoid_mf, [-0.1, 0, 4, 7, 1])
-    Headache_sev = T1FS(d_headache, trapezoid_mf, [4, 7, 10, 10.1, 1])
-
-    Rr_low = T1FS(d_rrate, trapezoid_mf, [9.9, 10, 16, 20, 1]) 
-    Rr_med = T1FS(d_rrate, trapezoid_mf, [16, 20, 25, 30, 1])  
-    Rr_high = T1FS(d_rrate, trapezoid_mf, [25, 30, 40, 40.1, 1]) 
-
-    Cough_low = T1FS(d_cough, trapezoid_mf, [-0.1, 0, 3.5, 5, 1])
-    Cough_high = T1FS(d_cough, trapezoid_mf, [4.5, 7, 10, 10.1, 1])
-
-    Sthroat_low = T1FS(d_sthroat, trapezoid_mf, [-0.1, 0, 0.2, 0.4, 1])
-    Sthroat_high = T1FS(d_sthroat, trapezoid_mf, [0.4, 0.6, 1, 1.1, 1])
-
-    Flu_no = T1FS(d_flu, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
-    Flu_yes = T1FS(d_flu, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
-
-    Vomit_no = T1FS(d_vomit, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
-    Vomit_yes = T1FS(d_vomit, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
-
-    Diarr_no = T1FS(d_diarr, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
-    Diarr_yes = T1FS(d_diarr, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
-
-    Ox_low = T1FS(d_oxygen, trapezoid_mf, [69.9, 70, 85, 92, 1]) 
-    Ox_normal = T1FS(d_oxygen, trapezoid_mf, [90, 95, 100, 100.1, 1]) 
-
-    # RESTRUCTURED OUTPUT UNIVERSE
-    Di_normal = T1FS(d_disease, trapezoid_mf, [-0.1, 0, 10, 15, 1])
-    Di_viral = T1FS(d_disease, trapezoid_mf, [15, 20, 25, 30, 1]) 
-    Di_corona = T1FS(d_disease, trapezoid_mf, [30, 35, 45, 50, 1])
-    Di_pneumo = T1FS(d_disease, trapezoid_mf, [50, 55, 65, 70, 1])
-    Di_typhoid = T1FS(d_disease, trapezoid_mf, [70, 75, 80, 85, 1])
-    Di_malaria = T1FS(d_disease, trapezoid_mf, [85, 90, 100, 100.1, 1])
-
-    SYS = T1Mamdani()
-    SYS.add_input_variable("Fever")
-    SYS.add_input_variable("Headache")
-    SYS.add_input_variable("RespRate")
-    SYS.add_input_variable("Cough")
-    SYS.add_input_variable("SoreThroat")
-    SYS.add_input_variable("Flu")
-    SYS.add_input_variable("Vomit")
-    SYS.add_input_variable("Diarrhea")
-    SYS.add_input_variable("Oxygen") 
-    SYS.add_output_variable("Disease")
-
-    # ==========================================================
-    # 4. RULE BASE: 100% COVERAGE MATRIX & EXPERT SYSTEM
-    # ==========================================================
-    
-    # 1. Normal Oxygen Scenarios
-    SYS.add_rule([("Fever", Fever_low), ("Oxygen", Ox_normal)], [("Disease", Di_normal)])
-    SYS.add_rule([("Fever", Fever_med), ("Oxygen", Ox_normal), ("Diarrhea", Diarr_no), ("Vomit", Vomit_no)], [("Disease", Di_viral)])
-    SYS.add_rule([("Fever", Fever_high), ("Oxygen", Ox_normal), ("Diarrhea", Diarr_no), ("Vomit", Vomit_no)], [("Disease", Di_viral)])
-
-    # 2. Low Oxygen Scenarios (Critical Respiratory)
-    SYS.add_rule([("Fever", Fever_low), ("Oxygen", Ox_low)], [("Disease", Di_pneumo)])
-    SYS.add_rule([("Fever", Fever_med), ("Oxygen", Ox_low)], [("Disease", Di_pneumo)])
-    SYS.add_rule([("Fever", Fever_high), ("Oxygen", Ox_low)], [("Disease", Di_corona)])
-
-    # 3. SPECIFIC DISEASE TARGETING
-    SYS.add_rule([("RespRate", Rr_high), ("Cough", Cough_high), ("Oxygen", Ox_low), ("Flu", Flu_no)], [("Disease", Di_pneumo)])
-    SYS.add_rule([("Fever", Fever_high), ("Diarrhea", Diarr_yes), ("Headache", Headache_sev)], [("Disease", Di_typhoid)])
-    SYS.add_rule([("Fever", Fever_med), ("Vomit", Vomit_yes), ("Headache", Headache_sev), ("Oxygen", Ox_normal)], [("Disease", Di_malaria)])
-    SYS.add_rule([("Fever", Fever_high), ("Vomit", Vomit_yes), ("Oxygen", Ox_normal)], [("Disease", Di_malaria)])
-    SYS.add_rule([("Cough", Cough_high), ("Flu", Flu_yes), ("Oxygen", Ox_low)], [("Disease", Di_corona)])
-
-    # 5. Execution & Safe Defuzzification
-    _, tr = SYS.evaluate({
-        "Fever": fever, "Headache": headache, "RespRate": rrate, "Cough": cough,
-        "SoreThroat": sthroat, "Flu": flu, "Vomit": vomit, "Diarrhea": diarr, "Oxygen": oxygen
-    })
-
-    disease_out = tr.get("Disease", 0.0)
-    
-    if isinstance(disease_out, (int, float, np.float64, np.float32)):
-        crisp_score = float(disease_out)
-    elif hasattr(disease_out, 'mf'):
-        mf_values = np.array(disease_out.mf)
-        if np.sum(mf_values) == 0:
-            crisp_score = 0.0
-        else:
-            crisp_score = float(np.sum(d_disease * mf_values) / np.sum(mf_values))
-    else:
-        crisp_score = 0.0
+# The engine every request goes through: the compiled backend (hot-reloaded
+# from the rule-base spec), memoized according to FUZZY_CACHE (see cache.py).
+# Each request pins one snapshot with ENGINE.current() so a reload mid-request
+# cannot mix rule-base versions.
+ENGINE = cached(engine.ENGINE)
 
-    if np.isnan(crisp_score):
-        return 0.0, "Inconclusive (Symptoms don't match clinical rules)"
+# Request counters / latency histograms for /metrics, shared by all Gunicorn
+# workers (see metrics.py), plus the opt-in runtime profiling hook.
+METRICS = metrics.from_env()
+PROFILE_DIR = os.environ.get("FUZZY_PROFILE_DIR")
 
-    if crisp_score < 0: crisp_score = 0
-    if crisp_score > 100: crisp_score = 100
+# Side-by-side rule-base versions (?version=) and shadow scoring (see registry.py)
+REGISTRY = registry.from_env(ENGINE, METRICS)
 
-    if 0 <= crisp_score < 15: label = "Normal"
-    elif 15 <= crisp_score < 30: label = "General Viral / Flu"
-    elif 30 <= crisp_score < 50: label = "Coronavirus"
-    elif 50 <= crisp_score < 70: label = "Pneumonia"
-    elif 70 <= crisp_score < 85: label = "Typhoid"
-    elif 85 <= crisp_score <= 100: label = "Malaria"
-    else: label = "Unknown"
+# Per-patient incremental scoring for streaming bedside vitals (see monitor.py)
+MONITOR = monitor.from_env(engine.ENGINE)
+
+# Server-side handoff PDFs rendered on a background process pool (see reports.py)
+REPORTS = reports.from_env(METRICS)
+
+# Upper bound on ?curve=N samples of the aggregated output set in explanations
+MAX_CURVE_POINTS = 1000
 
-    return crisp_score, label
 
 # ==========================================
 # PHASE 2: THE API AND FRONTEND (WEB)
@@ -496,22 +417,261 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# The page has no per-request variables: render it once, precompressed (see frontend.py)
+INDEX_PAGE = frontend.from_env(app.jinja_env.from_string(HTML_TEMPLATE).render())
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    status, body, headers = INDEX_PAGE.respond(request.headers.get('Accept-Encoding'),
+                                               request.headers.get('If-None-Match'))
+    return Response(body, status, headers)
 
 @app.route('/api/diagnose', methods=['POST'])
+@metrics.profiled(METRICS, PROFILE_DIR, "diagnose")
 def diagnose():
+    timer = METRICS.timer("diagnose")
+    version = request.args.get('version')
+    try:
+        current = REGISTRY.resolve(version)
+    except KeyError:
+        timer.finish(error=True)
+        return jsonify({"error": f"Unknown rule base version {version!r}", "versions": REGISTRY.versions()}), 404
     try:
-        data = request.json
-        score, disease = evaluate_disease_fuzzy(
-            data['fever'], data['headache'], data['rrate'], data['cough'],
-            data['sthroat'], data['flu'], data['vomit'], data['diarr'], data['oxygen']
-        )
-        return jsonify({"crisp_score": score, "disease": disease})
+        # malformed or out-of-universe inputs are refused before any fuzzy work
+        values = schema_for(current.rulebase).parse(request.get_json(silent=True))
+    except ValidationError as e:
+        timer.finish(error=True)
+        return jsonify({"error": "Invalid patient inputs", "fields": e.fields}), 400
+    timer.lap("parse")
+    try:
+        explanation = None
+        if request.args.get('explain', '0') not in ('0', 'false', ''):
+            # ?explain=1[&curve=N]: same evaluation, plus rule strengths and memberships
+            curve_points = min(max(request.args.get('curve', 0, type=int), 0), MAX_CURVE_POINTS)
+            score, disease, explanation = current.explain(values, curve_points)
+        else:
+            score, disease = current.evaluate(*values)
+        timer.lap("evaluate")
+        if version is None:
+            REGISTRY.observe([values], [disease], current)
+        if disease == current.rulebase.inconclusive:
+            timer.count("fuzzy_inconclusive_total", "diagnose")
+        result = {"crisp_score": score, "disease": disease, "rulebase_version": current.version}
+        if explanation is not None:
+            result["explanation"] = explanation
+        response = jsonify(result)
+        timer.lap("serialize")
+        timer.finish()
+        return response
     except Exception as e:
         traceback.print_exc()
+        timer.finish(error=True)
         return jsonify({"error": f"Math Exception: No rules triggered for these exact inputs or invalid fuzzy mapping. Details: {str(e)}"}), 500
 
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+@app.route('/api/diagnose/batch', methods=['POST'])
+@metrics.profiled(METRICS, PROFILE_DIR, "batch")
+def diagnose_batch():
+    # Accepts a JSON array, NDJSON or CSV body and streams back one NDJSON
+    # result per record; bad rows get an "error" entry instead of a 500.
+    timer = METRICS.timer("batch")
+    version = request.args.get('version')
+    try:
+        current = REGISTRY.resolve(version)
+    except KeyError:
+        timer.finish(error=True)
+        return jsonify({"error": f"Unknown rule base version {version!r}", "versions": REGISTRY.versions()}), 404
+    try:
+        records = iter_records(request.stream, request.content_type)
+    except ValueError as e:
+        timer.finish(error=True)
+        return jsonify({"error": str(e)}), 400
+    timer.lap("parse")
+
+    def generate():
+        # records are parsed lazily while scoring, so that time counts as evaluate
+        scored = errors = inconclusive = 0
+        evaluating = serializing = 0.0
+        # like /api/diagnose, only primary traffic is shadow-scored
+        observe = None if version is not None else functools.partial(REGISTRY.observe, current=current)
+        results = score_records(records, current, observe=observe)
+        try:
+            while True:
+                started = time.perf_counter()
+                result = next(results, None)
+                evaluated = time.perf_counter()
+                evaluating += evaluated - started
+                if result is None:
+                    break
+                if "error" in result:
+                    errors += 1
+                else:
+                    scored += 1
+                    inconclusive += result["disease"] == current.rulebase.inconclusive
+                line = json.dumps(result) + "\n"
+                serializing += time.perf_counter() - evaluated
+                yield line
+        finally:
+            timer.stage("evaluate", evaluating)
+            timer.stage("serialize", serializing)
+            timer.count("fuzzy_batch_rows_total", "scored", scored)
+            timer.count("fuzzy_batch_rows_total", "error", errors)
+            timer.count("fuzzy_inconclusive_total", "batch", inconclusive)
+            timer.finish()
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.headers["X-Rulebase-Version"] = current.version
+    return response
+
+@app.route('/api/sweep', methods=['POST'])
+@metrics.profiled(METRICS, PROFILE_DIR, "sweep")
+def diagnose_sweep():
+    # {"patient": {...nine fields}, "sweep": [{"field", "start", "stop", "steps"}, ...]}
+    # -> score / label surfaces over one or two swept inputs. Sweeps bypass the
+    # result cache so one plot cannot evict everyone else's entries.
+    timer = METRICS.timer("sweep")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        timer.finish(error=True)
+        return jsonify({"error": "Body must be a JSON object with 'patient' and 'sweep'"}), 400
+    timer.lap("parse")
+    current = engine.ENGINE.current()
+    try:
+        result = sweep(current, data.get("patient"), data.get("sweep"))
+    except ValidationError as e:
+        timer.finish(error=True)
+        return jsonify({"error": "Invalid patient inputs", "fields": e.fields}), 400
+    except ValueError as e:
+        timer.finish(error=True)
+        return jsonify({"error": str(e)}), 400
+    timer.lap("evaluate")
+    result["rulebase_version"] = current.version
+    response = jsonify(result)
+    timer.lap("serialize")
+    timer.finish()
+    return response
+
+@app.route('/api/monitor', methods=['POST'])
+@metrics.profiled(METRICS, PROFILE_DIR, "monitor")
+def monitor_update():
+    # One {"patient_id", ...fields} update or a list of them from bedside
+    # monitors; only updates that move the score or label produce an event.
+    timer = METRICS.timer("monitor")
+    data = request.get_json(silent=True)
+    updates = data if isinstance(data, list) else [data]
+    if not all(isinstance(update, dict) and "patient_id" in update for update in updates):
+        timer.finish(error=True)
+        return jsonify({"error": "Send an object (or array of objects) with 'patient_id' and the changed fields"}), 400
+    timer.lap("parse")
+    events = MONITOR.update_many([(str(update["patient_id"]), update) for update in updates])
+    timer.lap("evaluate")
+    response = jsonify({"events": events})
+    timer.lap("serialize")
+    timer.finish()
+    return response
+
+@app.route('/api/monitor/<patient_id>', methods=['DELETE'])
+def monitor_close(patient_id):
+    if not MONITOR.close(patient_id):
+        return jsonify({"error": f"No session for patient {patient_id!r}"}), 404
+    return jsonify({"closed": patient_id})
+
+@app.route('/api/monitor/stats')
+def monitor_stats():
+    return jsonify(MONITOR.stats())
+
+@app.route('/api/reports', methods=['POST'])
+@metrics.profiled(METRICS, PROFILE_DIR, "reports")
+def reports_submit():
+    # {"patients": [{...nine fields, "name", "age", "gender", "record_id"}, ...]}
+    # -> 202 with a job id. Patients are scored here, in one batch; the PDFs
+    # are rendered in the background and collected later as one zip.
+    timer = METRICS.timer("reports")
+    version = request.args.get('version')
+    try:
+        current = REGISTRY.resolve(version)
+    except KeyError:
+        timer.finish(error=True)
+        return jsonify({"error": f"Unknown rule base version {version!r}", "versions": REGISTRY.versions()}), 404
+    patients = (request.get_json(silent=True) or {}).get("patients")
+    if not isinstance(patients, list) or not 1 <= len(patients) <= reports.MAX_REPORTS:
+        timer.finish(error=True)
+        return jsonify({"error": f"'patients' must be a list of 1 to {reports.MAX_REPORTS} patients"}), 400
+    values, invalid = schema_for(current.rulebase).parse_many(patients)
+    if invalid:
+        timer.finish(error=True)
+        return jsonify({"error": "Invalid patient inputs",
+                        "rows": {str(row): e.fields for row, e in sorted(invalid.items())}}), 400
+    timer.lap("parse")
+    scores, labels = current.evaluate_batch(values)
+    timer.lap("evaluate")
+    jobs = []
+    for patient, row, score, disease in zip(patients, values.tolist(), scores, labels):
+        report = {key: str(patient[key])[:80] for key in ("name", "age", "gender", "record_id") if patient.get(key)}
+        report.update(inputs=dict(zip(engine.FIELDS, row)), crisp_score=score, disease=disease)
+        jobs.append(report)
+    try:
+        job_id = REPORTS.submit(jobs, current.version)
+    except reports.QueueFull as e:
+        timer.finish(error=True)
+        return jsonify({"error": f"Report queue is full ({e}); retry later"}), 503
+    response = jsonify({"job_id": job_id, "reports": len(jobs), "status": "pending", "rulebase_version": current.version})
+    timer.lap("serialize")
+    timer.finish()
+    return response, 202
+
+@app.route('/api/reports/<job_id>')
+def reports_status(job_id):
+    job = REPORTS.status(job_id)
+    if job is None:
+        return jsonify({"error": f"No report job {job_id!r}"}), 404
+    return jsonify(job)
+
+@app.route('/api/reports/<job_id>.zip')
+def reports_archive(job_id):
+    path = REPORTS.archive(job_id)
+    if path is None:
+        job = REPORTS.status(job_id)
+        if job is None:
+            return jsonify({"error": f"No report job {job_id!r}"}), 404
+        return jsonify(job), 409
+    return send_file(path, mimetype="application/zip", as_attachment=True,
+                     download_name=f"Clinical_Handoff_Reports_{job_id}.zip")
+
+@app.route('/api/reports/<job_id>/<int:index>.pdf')
+def reports_single(job_id, index):
+    # one report out of a finished job (0-based, in submission order)
+    pdf = REPORTS.report(job_id, index)
+    if pdf is None:
+        return jsonify({"error": f"No finished report {index} in job {job_id!r}"}), 404
+    return Response(pdf, mimetype="application/pdf",
+                    headers={"Content-Disposition": f"inline; filename=Clinical_Handoff_Report_{index}.pdf"})
+
+@app.route('/api/models')
+def models():
+    return jsonify(REGISTRY.stats())
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    if not isinstance(ENGINE, CachedEngine):
+        return jsonify({"storage": "off"})
+    return jsonify(ENGINE.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    current = ENGINE.current()
+    info = {"version": current.version, "fingerprint": current.fingerprint}
+    return Response(METRICS.render(info), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/profile', methods=['GET', 'POST'])
+def profile():
+    # POST {"requests": N} profiles the next N API requests (across workers)
+    # into FUZZY_PROFILE_DIR; only available when that variable is set.
+    if not PROFILE_DIR:
+        return jsonify({"error": "Profiling is disabled; set FUZZY_PROFILE_DIR to enable it"}), 404
+    if request.method == 'POST':
+        try:
+            requests = int((request.get_json(silent=True) or {}).get("requests", 100))
+        except (TypeError, ValueError):
+            return jsonify({"error": "requests must be an integer"}), 400
+        METRICS.request_profile(requests)
+    return jsonify({"remaining": METRICS.profile_remaining(), "directory": PROFILE_DIR})
\ No newline at end of file
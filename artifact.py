@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+
+import engine
+
+# ==========================================
+# COMPILED ENGINE ARTIFACT
+# ==========================================
+# A build step compiles the rule base into one binary file that workers
+# memory-map read-only instead of importing pyit2fls and compiling the
+# fuzzy model themselves:
+#
+#   python cli.py compile fuzzy_engine.bin --backend analytic
+#   FUZZY_ARTIFACT=fuzzy_engine.bin gunicorn app:app
+#
+# Layout: MAGIC, the header length as 8 little-endian bytes, a JSON header
+# (rule-base spec, defuzzification, fingerprint and a {name: dtype, shape,
+# offset, sha1} table), then every NumpyEngine lookup array (membership breakpoints, rule
+# matrices, sampled consequents or analytic crossings), each 64-byte aligned.
+# The arrays are read-only views straight into the mapping, so all workers on
+# a host share the same page-cache pages and startup costs one small JSON
+# parse. The arrays are hashed once, at build time; loading only checks the
+# header: the fingerprint is recomputed from the spec, so an artifact that
+# does not match its own rule base is refused.
+#
+# Rebuilds are written to a temporary file and renamed into place: workers
+# still mapping the old file keep their pages, and the hot-reload poll picks
+# up the new one.
+
+MAGIC = b"FUZZYENG"
+FORMAT = 2
+ALIGN = 64
+BACKENDS = ("numpy", "analytic")
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact is unreadable or does not match its rule base."""
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def save_artifact(compiled, path):
+    """Write a compiled NumpyEngine to `path` atomically."""
+    if not isinstance(compiled, engine.NumpyEngine):
+        raise ArtifactError(f"Only the {sorted(BACKENDS)} backends can be compiled into an artifact")
+    arrays = {name: np.ascontiguousarray(array) for name, array in compiled.arrays().items()}
+    table, offset = {}, 0
+    for name, array in arrays.items():
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset,
+                       "sha1": engine.array_digest(array)}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        "format": FORMAT,
+        "spec": compiled.rulebase.spec(),
+        "defuzzification": compiled.defuzzification,
+        "fingerprint": compiled.fingerprint,
+        "arrays": table,
+    }).encode()
+    start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+        for name, array in arrays.items():
+            f.seek(start + table[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def compile_artifact(path, backend="analytic", rulebase=None, resolution=None):
+    """Compile `rulebase` (default: $FUZZY_RULEBASE or rulebase.json) into an artifact."""
+    if backend not in BACKENDS:
+        raise ArtifactError(f"Unknown artifact backend {backend!r}; choose from {sorted(BACKENDS)}")
+    compiled = engine.build_engine(backend, rulebase or engine.load_rulebase(), resolution)
+    save_artifact(compiled, path)
+    return compiled
+
+
+def load_artifact(path):
+    """Memory-map an artifact and return the NumpyEngine it holds."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ArtifactError(f"{path} is not a compiled engine artifact")
+        length = int.from_bytes(f.read(8), "little")
+        try:
+            header = json.loads(f.read(length))
+        except ValueError as e:
+            raise ArtifactError(f"{path}: corrupt header ({e})")
+    if header.get("format") != FORMAT:
+        raise ArtifactError(f"{path}: unsupported artifact format {header.get('format')!r}; "
+                            f"rebuild it with python cli.py compile")
+
+    start = _aligned(len(MAGIC) + 8 + length)
+    mapping = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, meta in header["arrays"].items():
+        dtype = np.dtype(meta["dtype"])
+        offset = start + meta["offset"]
+        size = dtype.itemsize * int(np.prod(meta["shape"]))
+        if offset + size > mapping.size:
+            raise ArtifactError(f"{path}: truncated (array {name})")
+        arrays[name] = mapping[offset:offset + size].view(dtype).reshape(meta["shape"])
+
+    try:
+        rulebase = engine.RuleBase(header["spec"])
+    except (engine.RuleBaseError, TypeError, KeyError) as e:
+        raise ArtifactError(f"{path}: invalid rule base ({e})")
+    digests = {name: meta["sha1"] for name, meta in header["arrays"].items()}
+    compiled = engine.NumpyEngine.from_arrays(rulebase, arrays, header["defuzzification"], digests=digests)
+    if compiled.fingerprint != header["fingerprint"]:
+        raise ArtifactError(f"{path}: fingerprint {header['fingerprint']} does not match its rule base")
+    return compiled
@@ -0,0 +1,229 @@
+import asyncio
+import functools
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from app import ENGINE, INDEX_PAGE, METRICS, REGISTRY
+from schema import ValidationError, schema_for
+
+# ==========================================
+# ASYNC SERVING MODE WITH REQUEST COALESCING
+# ==========================================
+# An ASGI front end for the same engine, cache and metrics as app.py. Every
+# /api/diagnose request only parses its body and parks on a future; requests
+# that arrive within a short window are coalesced into one micro-batch and
+# scored with a single engine.evaluate_batch() call on a helper thread, then
+# the results are fanned back out to their callers.
+#
+#   FUZZY_COALESCE_WAIT_MS    max time the first request of a batch waits (default 2)
+#   FUZZY_COALESCE_MAX_BATCH  max patients per micro-batch (default 256)
+#
+# Only one micro-batch per process is evaluated at a time; requests arriving
+# meanwhile queue up and go out as the next batch as soon as it finishes, so
+# under a spike the batches grow instead of the queue of threads. A request
+# therefore waits at most max wait + two batch evaluations. Pair it with a
+# vectorized backend (FUZZY_ENGINE=numpy or analytic), where a batch of 256
+# costs little more than a single patient.
+#
+#   uvicorn asgi:app --workers 4
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+#
+# The "evaluate" stage in /metrics includes the time spent waiting for the
+# batch to form.
+
+DEFAULT_MAX_WAIT_MS = 2
+DEFAULT_MAX_BATCH = 256
+
+
+class MicroBatcher:
+    """Coalesces concurrent evaluate() calls into engine.evaluate_batch() calls."""
+
+    def __init__(self, engine, max_wait=DEFAULT_MAX_WAIT_MS / 1000, max_batch=DEFAULT_MAX_BATCH, metrics=None,
+                 registry=None):
+        self.engine = engine
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self.registry = registry
+        self._pending = []
+        self._timer = None
+        self._running = False
+        # created lazily so a preloaded master never starts threads before forking
+        self._executor = None
+
+    async def evaluate(self, values):
+        """Score one patient; returns (crisp_score, label, pinned engine)."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append((values, waiter))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None and not self._running:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+        return await waiter
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._running or not self._pending:
+            return
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fuzzy-batch")
+        self._running = True
+        done = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._score, [values for values, _ in batch])
+        done.add_done_callback(functools.partial(self._deliver, batch))
+
+    def _score(self, rows):
+        # one snapshot for the whole batch, so every caller sees one rule-base version
+        current = self.engine.current()
+        try:
+            scores, labels = current.evaluate_batch(rows)
+            results = [(score, label, current) for score, label in zip(scores, labels)]
+        except Exception:
+            # isolate the offending row(s) by falling back to one-at-a-time
+            results = []
+            for values in rows:
+                try:
+                    results.append(current.evaluate(*values) + (current,))
+                except Exception as e:
+                    results.append(e)
+        if self.registry is not None:
+            # one shadow-scoring job per micro-batch
+            scored = [(values, result[1]) for values, result in zip(rows, results) if not isinstance(result, Exception)]
+            if scored:
+                self.registry.observe([values for values, _ in scored], [label for _, label in scored], current)
+        if self.metrics is not None:
+            self.metrics.record([(("fuzzy_coalesced_total", "batches"), 1),
+                                 (("fuzzy_coalesced_total", "patients"), len(rows))])
+        return results
+
+    def _deliver(self, batch, done):
+        self._running = False
+        try:
+            results = done.result()
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, waiter), result in zip(batch, results):
+            if waiter.done():   # the client went away
+                continue
+            if isinstance(result, Exception):
+                waiter.set_exception(result)
+            else:
+                waiter.set_result(result)
+        # whatever queued up during this batch has already waited long enough
+        if self._pending:
+            self._dispatch()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def batcher_from_env(engine, metrics=None, registry=None):
+    max_wait = float(os.environ.get("FUZZY_COALESCE_WAIT_MS", DEFAULT_MAX_WAIT_MS)) / 1000
+    max_batch = int(os.environ.get("FUZZY_COALESCE_MAX_BATCH", DEFAULT_MAX_BATCH))
+    if max_wait < 0 or max_batch < 1:
+        raise ValueError("FUZZY_COALESCE_WAIT_MS must be >= 0 and FUZZY_COALESCE_MAX_BATCH >= 1")
+    return MicroBatcher(engine, max_wait, max_batch, metrics, registry)
+
+
+BATCHER = batcher_from_env(ENGINE, METRICS, REGISTRY)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _respond(send, status, body, content_type="application/json", headers=()):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()),
+                            (b"content-length", str(len(body)).encode())] + list(headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def diagnose(receive, send):
+    timer = METRICS.timer("diagnose")
+    try:
+        data = json.loads(await _read_body(receive))
+    except ValueError:
+        data = None
+    try:
+        values = schema_for(ENGINE.current().rulebase).parse(data)
+    except ValidationError as e:
+        timer.finish(error=True)
+        return await _respond(send, 400, {"error": "Invalid patient inputs", "fields": e.fields})
+    timer.lap("parse")
+    try:
+        score, disease, current = await BATCHER.evaluate(values)
+    except Exception as e:
+        traceback.print_exc()
+        timer.finish(error=True)
+        return await _respond(send, 500, {"error": f"Math Exception: No rules triggered for these exact inputs or invalid fuzzy mapping. Details: {str(e)}"})
+    timer.lap("evaluate")
+    if disease == current.rulebase.inconclusive:
+        timer.count("fuzzy_inconclusive_total", "diagnose")
+    body = json.dumps({"crisp_score": score, "disease": disease, "rulebase_version": current.version}).encode()
+    timer.lap("serialize")
+    timer.finish()
+    await _respond(send, 200, body)
+
+
+async def index(scope, send):
+    request_headers = dict(scope["headers"])
+    status, body, headers = INDEX_PAGE.respond(request_headers.get(b"accept-encoding", b"").decode("latin-1"),
+                                               request_headers.get(b"if-none-match", b"").decode("latin-1"))
+    headers = [(name.lower().encode(), value.encode()) for name, value in headers]
+    if status == 200:
+        headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            BATCHER.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    path, method = scope["path"], scope["method"]
+
+    if path == "/api/diagnose":
+        if method != "POST":
+            return await _respond(send, 405, {"error": "Method not allowed"}, headers=[(b"allow", b"POST")])
+        return await diagnose(receive, send)
+    if path == "/" and method in ("GET", "HEAD"):
+        return await index(scope, send)
+    if path == "/metrics" and method == "GET":
+        current = ENGINE.current()
+        info = {"version": current.version, "fingerprint": current.fingerprint}
+        return await _respond(send, 200, METRICS.render(info).encode(), "text/plain; version=0.0.4")
+    await _respond(send, 404, {"error": "Not found"})
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The async server requires uvicorn (pip install uvicorn)")
+    uvicorn.run(app, host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", 8000)))
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import re
+
+from schema import schema_for
+
+# ==========================================
+# BATCH SCORING HELPERS
+# ==========================================
+# Shared by /api/diagnose/batch: turn a JSON array, NDJSON or CSV body into
+# patient records one at a time, and score them in fixed-size chunks so a
+# huge upload never has to sit in memory all at once. JSON arrays are decoded
+# element by element as the body arrives, like NDJSON lines.
+
+BATCH_CHUNK_SIZE = 256
+JSON_READ_SIZE = 64 * 1024
+MAX_RECORD_CHARS = 1024 * 1024
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _text_lines(stream):
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+def _ndjson_records(stream):
+    for line in _text_lines(stream):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON line: {e}")
+
+
+def _json_array_records(reader, buffer):
+    """
+    Yield the elements of a JSON array body one at a time.
+
+    `buffer` is the text already read after the opening '['. Only the chunk
+    being decoded is held in memory. A malformed element (or an array that
+    never closes) is yielded as a ValueError and ends the records.
+    """
+    pos, eof, first = 0, False, True
+    while True:
+        start = _WHITESPACE.match(buffer, pos).end()
+        empty = first and buffer.startswith("]", start)
+        error = None
+        if empty:
+            after = start
+        else:
+            try:
+                record, end = _DECODER.raw_decode(buffer, start)
+                after = _WHITESPACE.match(buffer, end).end()
+            except ValueError as e:
+                error, after = e, len(buffer)
+        if after == len(buffer):
+            # the element, or the ',' / ']' after it, continues in the next chunk
+            if eof:
+                yield ValueError(f"Invalid JSON body: {error.msg if error else 'unterminated array'}")
+                return
+            if len(buffer) - pos > MAX_RECORD_CHARS:
+                yield ValueError(f"Invalid JSON body: record longer than {MAX_RECORD_CHARS} characters")
+                return
+            chunk = reader.read(JSON_READ_SIZE)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        if not empty:
+            yield record
+        first = False
+        if buffer[after] == ",":
+            pos = after + 1
+            continue
+        if buffer[after] != "]":
+            yield ValueError(f"Invalid JSON body: expected ',' or ']' after a record, got {buffer[after]!r}")
+            return
+        tail = buffer[after + 1:]
+        while tail.strip(" \t\n\r") == "" and not eof:
+            tail = reader.read(JSON_READ_SIZE)
+            eof = not tail
+        if tail.strip(" \t\n\r"):
+            yield ValueError("Invalid JSON body: extra data after the array")
+        return
+
+
+def iter_records(stream, content_type):
+    """
+    Return an iterator over the patient records in a request body.
+
+    Body-level problems (unsupported type, a JSON body that is not an array)
+    raise ValueError right away, before any response is streamed. NDJSON
+    lines and JSON array elements that cannot be decoded are yielded as
+    ValueError instances so the caller can report them against their row
+    index; a malformed array element also ends the records.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonlines"):
+        return _ndjson_records(stream)
+
+    if content_type == "text/csv":
+        return csv.DictReader(_text_lines(stream))
+
+    if content_type == "application/json":
+        reader = _text_lines(stream)
+        head = ""
+        while not head.strip(" \t\n\r"):
+            chunk = reader.read(JSON_READ_SIZE)
+            if not chunk:
+                break
+            head += chunk
+        head = head.lstrip(" \t\n\r")
+        if not head.startswith("["):
+            raise ValueError("JSON body must be an array of patient records")
+        return _json_array_records(reader, head[1:])
+
+    raise ValueError("Unsupported Content-Type; send application/json, application/x-ndjson or text/csv")
+
+
+def score_records(records, engine, chunk_size=BATCH_CHUNK_SIZE, schema=None, observe=None):
+    """
+    Score records lazily, yielding one result dict per record in input order.
+
+    Records are gathered into chunks, validated column-wise against `schema`
+    (default: the engine's rule base under $FUZZY_VALIDATION) and the valid
+    rows sent through engine.evaluate_batch; rows that fail validation (or a
+    chunk that fails to evaluate) become per-row {"index", "error"} results
+    instead of aborting the whole batch. `observe(rows, labels)`, if given,
+    is called once per chunk with the rows that were scored.
+    """
+    schema = schema or schema_for(engine.rulebase)
+    pending = []
+
+    def flush():
+        decoded = [(i, record) for i, (_, record) in enumerate(pending) if not isinstance(record, Exception)]
+        values, invalid = schema.parse_many([record for _, record in decoded])
+        problems = {i: record for i, (_, record) in enumerate(pending) if isinstance(record, Exception)}
+        problems.update((decoded[row][0], error) for row, error in invalid.items())
+        rows = values[[row for row in range(len(decoded)) if row not in invalid]]
+        try:
+            scores, labels = engine.evaluate_batch(rows) if len(rows) else ([], [])
+            outcomes = iter(zip(scores, labels))
+        except Exception:
+            # isolate the offending row(s) by falling back to one-at-a-time
+            outcomes = None
+        valid = iter(rows.tolist())
+        scored, scored_labels = [], []
+        for i, (index, _) in enumerate(pending):
+            if i in problems:
+                yield {"index": index, "error": str(problems[i])}
+                continue
+            row = next(valid)
+            try:
+                score, label = next(outcomes) if outcomes is not None else engine.evaluate(*row)
+            except Exception as e:
+                yield {"index": index, "error": f"Math Exception: {e}"}
+                continue
+            scored.append(row)
+            scored_labels.append(label)
+            yield {"index": index, "crisp_score": score, "disease": label}
+        pending.clear()
+        if observe is not None and scored:
+            observe(scored, scored_labels)
+
+    for index, record in enumerate(records):
+        pending.append((index, record))
+        if len(pending) >= chunk_size:
+            yield from flush()
+    yield from flush()
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import engine
+from lut import BOOLEAN_FIELDS
+
+# ==========================================
+# BENCHMARK SUITE
+# ==========================================
+# Reproducible performance numbers for the diagnosis pipeline:
+#
+#   latency      single app.ENGINE.evaluate() calls (p50 / p95 / p99 in µs)
+#   batch        app.ENGINE evaluate_batch() throughput in rows/sec
+#   flask        POST /api/diagnose through the WSGI test client, requests/sec
+#   memory       peak RSS of the worker process that ran the scenarios above
+#
+# Every backend runs in a fresh child process (so peak memory is per worker
+# and nothing leaks between backends) on the same seeded patients. Each
+# scenario is warmed up once and then timed --repeats times (default 5); the
+# report keeps the median of every metric, so one noisy run neither hides nor
+# fakes a regression.
+#
+#   python bench.py --output baseline.json
+#   python bench.py --compare baseline.json        # exit 1 on a regression
+#
+# The scenarios go through app.ENGINE, the same (possibly cached) engine
+# /api/diagnose uses. The cache is off by default so the numbers measure the
+# engine; pass --cache worker to measure the cached path instead.
+
+DEFAULT_SEED = 1234
+LATENCY_CALLS = 300
+BATCH_SIZE = 2000
+FLASK_REQUESTS = 300
+REPEATS = 5
+REGRESSION_THRESHOLD = 0.2
+
+# metric -> True when higher is better
+METRICS = {
+    "latency_p50_us": False,
+    "latency_p95_us": False,
+    "latency_p99_us": False,
+    "batch_rows_per_sec": True,
+    "flask_requests_per_sec": True,
+    "peak_rss_mb": False,
+}
+
+
+def rule_covering_patients(rulebase, n, seed=DEFAULT_SEED):
+    """
+    Seeded synthetic patients that fire every rule of `rulebase`.
+
+    Patients are built round-robin from the rules: each one starts uniform
+    over the universes, then every antecedent input is moved into the core of
+    its fuzzy set (so that rule fires at full strength). Booleans are 0/1.
+    """
+    rng = np.random.default_rng(seed)
+    bounds = np.array([rulebase.universes[var] for _, var in rulebase.inputs], dtype=float)
+    column = {var: i for i, (_, var) in enumerate(rulebase.inputs)}
+    flags = [i for i, (field, _) in enumerate(rulebase.inputs) if field in BOOLEAN_FIELDS]
+
+    patients = bounds[:, 0] + rng.random((n, len(bounds))) * (bounds[:, 1] - bounds[:, 0])
+    patients[:, flags] = np.round(patients[:, flags])
+    for row in range(n):
+        antecedent, _ = rulebase.rules[row % len(rulebase.rules)]
+        for var, name in antecedent:
+            a, b, c, d, h = rulebase.sets[var][name]
+            lo, hi = rulebase.universes[var]
+            core = (max(b, lo), min(c, hi))
+            if column[var] in flags:
+                patients[row, column[var]] = round((core[0] + core[1]) / 2)
+            else:
+                patients[row, column[var]] = rng.uniform(*core)
+    return patients
+
+
+def _percentile_us(samples, q):
+    return float(np.percentile(samples, q) * 1e6)
+
+
+def _median(runs):
+    """Median of every metric over the repeated runs of one scenario."""
+    return {metric: float(np.median([run[metric] for run in runs])) for metric in runs[0]}
+
+
+def _repeat(scenario, repeats):
+    scenario()   # warm up: first-call allocations, lazy imports, cache fill
+    return _median([scenario() for _ in range(repeats)])
+
+
+def _bench_latency(evaluate, patients, calls):
+    samples = []
+    for row in patients[:calls]:
+        start = time.perf_counter()
+        evaluate(*row)
+        samples.append(time.perf_counter() - start)
+    return {"latency_p50_us": _percentile_us(samples, 50),
+            "latency_p95_us": _percentile_us(samples, 95),
+            "latency_p99_us": _percentile_us(samples, 99),
+            "latency_mean_us": float(np.mean(samples) * 1e6)}
+
+
+def _bench_batch(current, patients):
+    start = time.perf_counter()
+    current.evaluate_batch(patients)
+    elapsed = time.perf_counter() - start
+    return {"batch_rows": len(patients), "batch_rows_per_sec": len(patients) / elapsed}
+
+
+def _bench_flask(client, bodies):
+    start = time.perf_counter()
+    for body in bodies:
+        response = client.post("/api/diagnose", json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/diagnose returned {response.status_code}: {response.get_data(as_text=True)}")
+    elapsed = time.perf_counter() - start
+    return {"flask_requests": len(bodies), "flask_requests_per_sec": len(bodies) / elapsed}
+
+
+def run_worker(seed, latency_calls, batch_size, flask_requests, repeats=REPEATS):
+    """Run every scenario against the backend chosen by FUZZY_ENGINE in this process."""
+    started = time.perf_counter()
+    import app   # builds engine.ENGINE (and the cache wrapper) from the environment
+    startup = time.perf_counter() - started
+
+    current = app.ENGINE.current()
+    patients = rule_covering_patients(current.rulebase, max(latency_calls, batch_size, flask_requests), seed)
+    rows = patients.tolist()
+    client = app.app.test_client()
+    bodies = [dict(zip(engine.FIELDS, row)) for row in rows[:flask_requests]]
+    results = {"startup_sec": startup, "repeats": repeats}
+    results.update(_repeat(lambda: _bench_latency(app.ENGINE.evaluate, rows, latency_calls), repeats))
+    results.update(_repeat(lambda: _bench_batch(app.ENGINE.current(), patients[:batch_size]), repeats))
+    results.update(_repeat(lambda: _bench_flask(client, bodies), repeats))
+    # ru_maxrss is in KiB on Linux
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def run_benchmarks(backends, seed=DEFAULT_SEED, latency_calls=LATENCY_CALLS, batch_size=BATCH_SIZE,
+                   flask_requests=FLASK_REQUESTS, cache="off", repeats=REPEATS, log=sys.stderr):
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+            "latency_calls": latency_calls,
+            "batch_size": batch_size,
+            "flask_requests": flask_requests,
+            "cache": cache,
+            "repeats": repeats,
+        },
+        "results": {},
+    }
+    for backend in backends:
+        print(f"Benchmarking {backend}...", file=log)
+        env = dict(os.environ, FUZZY_ENGINE=backend, FUZZY_CACHE=cache)
+        child = subprocess.run(
+            [sys.executable, "-W", "ignore", os.path.abspath(__file__), "--worker",
+             "--seed", str(seed), "--latency-calls", str(latency_calls),
+             "--batch-size", str(batch_size), "--flask-requests", str(flask_requests),
+             "--repeats", str(repeats)],
+            env=env, stdout=subprocess.PIPE, check=True, text=True)
+        report["results"][backend] = json.loads(child.stdout)
+
+    # how every backend compares with the reference pyit2fls path in this run
+    reference = report["results"].get("pyit2fls")
+    if reference:
+        for results in report["results"].values():
+            results["speedup_vs_pyit2fls"] = {
+                "latency_p50": reference["latency_p50_us"] / results["latency_p50_us"],
+                "batch": results["batch_rows_per_sec"] / reference["batch_rows_per_sec"],
+                "flask": results["flask_requests_per_sec"] / reference["flask_requests_per_sec"],
+            }
+    return report
+
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return (lines, regressions) comparing `report` with a saved baseline report."""
+    lines, regressions = [], []
+    for backend, results in report["results"].items():
+        before = baseline.get("results", {}).get(backend)
+        if before is None:
+            lines.append(f"{backend}: not in baseline")
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in before or metric not in results:
+                continue
+            old, new = before[metric], results[metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions.append((backend, metric, old, new))
+            lines.append(f"{backend:>10} {metric:<24} {old:>14.1f} -> {new:>14.1f} ({change:+.1%}){flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fuzzy diagnosis pipeline")
+    parser.add_argument("--backends", default=",".join(engine.BACKENDS),
+                        help="comma-separated backends (default: all)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--latency-calls", type=int, default=LATENCY_CALLS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--flask-requests", type=int, default=FLASK_REQUESTS)
+    parser.add_argument("--repeats", type=int, default=REPEATS,
+                        help="timed runs per scenario after the warm-up; the median is reported (default: 5)")
+    parser.add_argument("--cache", default="off", help="FUZZY_CACHE for the workers (default: off)")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved report")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown that counts as a regression (default: 0.2)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+
+    if args.worker:
+        json.dump(run_worker(args.seed, args.latency_calls, args.batch_size, args.flask_requests, args.repeats),
+                  sys.stdout)
+        return 0
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in engine.BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend(s) {unknown}; choose from {sorted(engine.BACKENDS)}")
+
+    report = run_benchmarks(backends, args.seed, args.latency_calls, args.batch_size,
+                            args.flask_requests, args.cache, args.repeats)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            lines, regressions = compare(report, json.load(f), args.threshold)
+        print("\n".join(lines), file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import engine
+
+# ==========================================
+# MEMOIZING RESULT CACHE
+# ==========================================
+# Triage inputs come from quantized devices and sliders, so identical input
+# tuples repeat constantly. CachedEngine sits in front of any engine backend
+# and remembers (crisp_score, label) per input tuple.
+#
+#   FUZZY_CACHE           off | worker (default) | shared
+#   FUZZY_CACHE_SIZE      max entries (default 65536)
+#   FUZZY_CACHE_QUANTIZE  none (default) | triage | "fever=0.1,oxygen=1,..."
+#
+# "worker" keeps an exact LRU per process. "shared" keeps one table in
+# shared memory for every Gunicorn worker forked from the master; it is
+# 8-way set-associative with LRU eviction inside each set.
+#
+# Keys include the engine's rule-base fingerprint, so results computed by an
+# older rule base are never returned once the rules or membership
+# parameters change.
+
+DEFAULT_SIZE = 65536
+
+# Step per field; inputs are rounded to the nearest step before lookup *and*
+# before evaluation, so a cached result is exactly what the engine returns
+# for the quantized inputs.
+QUANTIZE_POLICIES = {
+    "none": {},
+    "triage": {
+        "fever": 0.1,
+        "headache": 1, "cough": 1,
+        "rrate": 1, "oxygen": 1,
+        "sthroat": 1, "flu": 1, "vomit": 1, "diarr": 1,
+    },
+}
+
+
+def parse_policy(spec):
+    """'triage' or 'fever=0.1,oxygen=1' -> {field: step}."""
+    spec = (spec or "none").strip()
+    if spec in QUANTIZE_POLICIES:
+        return dict(QUANTIZE_POLICIES[spec])
+    policy = {}
+    for part in spec.split(","):
+        field, _, step = part.partition("=")
+        field = field.strip()
+        if field not in engine.FIELDS:
+            raise ValueError(f"Unknown field {field!r} in quantization policy {spec!r}")
+        policy[field] = float(step)
+    return policy
+
+
+class Quantizer:
+    __slots__ = ("steps",)
+
+    def __init__(self, policy):
+        self.steps = np.array([policy.get(field, 0) for field in engine.FIELDS], dtype=float)
+
+    def __call__(self, patients):
+        patients = np.atleast_2d(np.asarray(patients, dtype=float))
+        if not self.steps.any():
+            return patients
+        quantized = patients.copy()
+        cols = self.steps > 0
+        quantized[:, cols] = np.round(patients[:, cols] / self.steps[cols]) * self.steps[cols]
+        return quantized
+
+
+class WorkerStore:
+    """Exact LRU cache local to one process."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, labels):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, labels):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {"storage": "worker", "pid": os.getpid(), "capacity": self.size,
+                "entries": len(self._entries), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+class SharedStore:
+    """
+    Set-associative cache in a shared-memory block, shared by forked workers.
+
+    Create it in the master process before workers fork (Gunicorn's
+    preload_app does this) so every worker inherits the same mapping and lock.
+    """
+    WAYS = 8
+
+    def __init__(self, size):
+        self.sets = max(1, size // self.WAYS)
+        slots = self.sets * self.WAYS
+        width = len(engine.FIELDS)
+        layout = [("keys", np.float64, (slots, width)), ("tags", np.uint64, (slots,)),
+                  ("scores", np.float64, (slots,)), ("labels", np.int16, (slots,)),
+                  ("stamps", np.uint64, (slots,)), ("counters", np.int64, (4,))]
+        nbytes = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in layout)
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._owner = os.getpid()
+        atexit.register(self._release)
+
+        offset = 0
+        for name, dtype, shape in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+            array.fill(0)
+            setattr(self, "_" + name, array)
+            offset += array.nbytes
+        self._lock = multiprocessing.Lock()
+
+    def _release(self):
+        self._shm.close()
+        if os.getpid() == self._owner:
+            self._shm.unlink()
+
+    def _slots(self, key):
+        fingerprint, values = key
+        start = (hash(values) ^ fingerprint) % self.sets * self.WAYS
+        return start, start + self.WAYS
+
+    # counters: [clock, hits, misses, evictions]
+    # labels are stored as indexes into the rule base's label_names, which is
+    # safe because the fingerprint in every key pins the rule base
+    def get(self, key, labels):
+        fingerprint, values = key
+        start, stop = self._slots(key)
+        with self._lock:
+            self._counters[0] += 1
+            for slot in range(start, stop):
+                if self._stamps[slot] and self._tags[slot] == fingerprint \
+                        and tuple(self._keys[slot].tolist()) == values:
+                    self._stamps[slot] = self._counters[0]
+                    self._counters[1] += 1
+                    return float(self._scores[slot]), labels[self._labels[slot]]
+            self._counters[2] += 1
+            return None
+
+    def put(self, key, value, labels):
+        fingerprint, values = key
+        score, label = value
+        if label not in labels:
+            return
+        start, stop = self._slots(key)
+        with self._lock:
+            self._counters[0] += 1
+            ways = self._stamps[start:stop]
+            slot = start + int(np.argmin(ways))   # empty slots have stamp 0
+            if ways[slot - start]:
+                self._counters[3] += 1
+            self._keys[slot] = values
+            self._tags[slot] = fingerprint
+            self._scores[slot] = score
+            self._labels[slot] = labels.index(label)
+            self._stamps[slot] = self._counters[0]
+
+    def stats(self):
+        with self._lock:
+            hits, misses, evictions = (int(v) for v in self._counters[1:])
+            entries = int(np.count_nonzero(self._stamps))
+        return {"storage": "shared", "capacity": self.sets * self.WAYS, "entries": entries,
+                "hits": hits, "misses": misses, "evictions": evictions}
+
+
+STORES = {
+    "worker": WorkerStore,
+    "shared": SharedStore,
+}
+
+
+class CachedEngine:
+    """
+    Drop-in engine wrapper that memoizes evaluate() / evaluate_batch().
+
+    `inner` may be a ReloadingEngine: current() pins the compiled engine for
+    one request and returns a view sharing this wrapper's store.
+    """
+
+    def __init__(self, inner, store, quantizer):
+        self.inner = inner
+        self.store = store
+        self.quantize = quantizer
+
+    def current(self):
+        inner = self.inner.current()
+        if inner is self.inner:
+            return self
+        return CachedEngine(inner, self.store, self.quantize)
+
+    @property
+    def version(self):
+        return self.inner.version
+
+    @property
+    def fingerprint(self):
+        return self.inner.fingerprint
+
+    @property
+    def rulebase(self):
+        return self.inner.rulebase
+
+    def evaluate(self, fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+        scores, labels = self.evaluate_batch([[fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen]])
+        return scores[0], labels[0]
+
+    def evaluate_batch(self, patients):
+        """Score an (n, 9) array of patients; returns (scores, labels) lists."""
+        inner = self.inner.current()
+        fingerprint, names = int(inner.fingerprint, 16), inner.rulebase.label_names
+        rows = self.quantize(patients).tolist()
+        results = [self.store.get((fingerprint, tuple(row)), names) for row in rows]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            scores, labels = inner.evaluate_batch([rows[i] for i in missing])
+            for i, score, label in zip(missing, scores, labels):
+                results[i] = (score, label)
+                self.store.put((fingerprint, tuple(rows[i])), results[i], names)
+        return [score for score, _ in results], [label for _, label in results]
+
+    def explain(self, values, curve_points=0):
+        # explanations are opt-in and rare: not worth a cache entry
+        return self.inner.current().explain(self.quantize([values])[0].tolist(), curve_points)
+
+    def stats(self):
+        stats = self.store.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cached(inner, storage=None, size=None, quantize=None):
+    """Wrap `inner` according to FUZZY_CACHE*; returns it unchanged when caching is off."""
+    storage = storage or os.environ.get("FUZZY_CACHE", "worker")
+    if storage == "off":
+        return inner
+    if storage not in STORES:
+        raise ValueError(f"Unknown FUZZY_CACHE storage {storage!r}; choose off, worker or shared")
+    size = size or int(os.environ.get("FUZZY_CACHE_SIZE", DEFAULT_SIZE))
+    policy = parse_policy(quantize or os.environ.get("FUZZY_CACHE_QUANTIZE"))
+    return CachedEngine(inner, STORES[storage](size), Quantizer(policy))
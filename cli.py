@@ -0,0 +1,200 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import artifact
+import engine
+from batch import score_records
+
+# ==========================================
+# OFFLINE COMMAND LINE INTERFACE
+# ==========================================
+# Scores large patient files without going through Flask:
+#
+#   python cli.py score registry.csv scores.csv --workers 8
+#
+# The input is read in chunks, chunks are scored on a process pool, and the
+# results are appended to the output in input order. After every chunk a
+# checkpoint (<output>.checkpoint) records how far we got, so re-running the
+# same command after a crash resumes instead of starting over. The checkpoint
+# also records the backend and engine fingerprint; resuming with a different
+# backend or rule base is refused (pass --no-resume to start over), so one
+# output file never mixes scores from two engines.
+#
+#   python cli.py compile fuzzy_engine.bin
+#
+# builds the memory-mapped engine artifact served with FUZZY_ARTIFACT (see
+# artifact.py).
+
+OUTPUT_COLUMNS = ["row", "crisp_score", "disease", "error"]
+
+_worker_engine = None
+
+
+def _init_worker(backend, rulebase_path, fingerprint):
+    global _worker_engine
+    _worker_engine = engine.build_engine(backend, engine.load_rulebase(rulebase_path))
+    if _worker_engine.fingerprint != fingerprint:
+        # the rule-base file changed between the parent's check and this worker
+        raise RuntimeError(f"rule base changed while scoring (fingerprint {_worker_engine.fingerprint}, "
+                           f"expected {fingerprint})")
+
+
+def _score_chunk(start, records):
+    results = []
+    for result in score_records(records, _worker_engine, chunk_size=len(records) or 1):
+        results.append([start + result["index"], result.get("crisp_score", ""),
+                        result.get("disease", ""), result.get("error", "")])
+    return results
+
+
+def read_records(path):
+    """Yield input rows as dicts from a .csv, .ndjson/.jsonl or .parquet file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading .parquet files requires pyarrow (pip install pyarrow)")
+        for table in pq.ParquetFile(path).iter_batches(columns=list(engine.FIELDS)):
+            yield from table.to_pylist()
+    elif ext in (".ndjson", ".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield ValueError(f"Invalid JSON line: {e}")
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def score_file(input_path, output_path, workers=None, chunk_size=10000, backend=None,
+               rulebase_path=None, resume=True, log=sys.stderr):
+    """Score every row of input_path into output_path; returns rows scored this run."""
+    backend = backend or os.environ.get("FUZZY_ENGINE", "pyit2fls")
+    fingerprint = engine.build_engine(backend, engine.load_rulebase(rulebase_path)).fingerprint
+    checkpoint_path = output_path + ".checkpoint"
+    state = _load_checkpoint(checkpoint_path) if resume else None
+    if state and state.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"{checkpoint_path} belongs to a different input ({state.get('input')})")
+    if state and (state.get("backend"), state.get("fingerprint")) != (backend, fingerprint):
+        raise SystemExit(f"{checkpoint_path} was written by backend {state.get('backend')} with engine "
+                         f"{state.get('fingerprint')}, not {backend} with {fingerprint}; "
+                         f"pass --no-resume to start over")
+    if state and (not os.path.exists(output_path) or os.path.getsize(output_path) < state["offset"]):
+        print(f"{output_path} is missing or shorter than its checkpoint; starting over", file=log)
+        state = None
+
+    done = state["rows"] if state else 0
+    out = open(output_path, "r+" if state else "w", newline="", encoding="utf-8")
+    if state:
+        # drop anything written after the last checkpoint (e.g. a half-written chunk)
+        out.truncate(state["offset"])
+        out.seek(state["offset"])
+        print(f"Resuming {input_path} from row {done}", file=log)
+    writer = csv.writer(out)
+    if not state:
+        writer.writerow(OUTPUT_COLUMNS)
+
+    records = itertools.islice(read_records(input_path), done, None)
+    chunks = ((done + i * chunk_size, chunk)
+              for i, chunk in enumerate(iter(lambda: list(itertools.islice(records, chunk_size)), [])))
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    started = time.perf_counter()
+    scored = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(backend, rulebase_path, fingerprint)) as pool:
+            in_flight = []
+            for start, chunk in itertools.chain(chunks, [(None, None)]):
+                if start is not None:
+                    in_flight.append(pool.submit(_score_chunk, start, chunk))
+                # write finished chunks in order, keeping a bounded number queued
+                while in_flight and (start is None or len(in_flight) >= max_in_flight
+                                     or in_flight[0].done()):
+                    rows = in_flight.pop(0).result()
+                    writer.writerows(rows)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    scored += len(rows)
+                    _save_checkpoint(checkpoint_path, {
+                        "input": os.path.abspath(input_path),
+                        "backend": backend,
+                        "fingerprint": fingerprint,
+                        "rows": done + scored,
+                        "offset": out.tell(),
+                    })
+                    elapsed = time.perf_counter() - started
+                    print(f"{done + scored} rows scored ({scored / elapsed:,.0f} rows/sec)", file=log)
+    finally:
+        out.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.perf_counter() - started
+    rate = scored / elapsed if elapsed else 0.0
+    print(f"Done: {scored} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec) -> {output_path}", file=log)
+    return scored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzzy diagnostic engine command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    score = commands.add_parser("score", help="score a CSV / NDJSON / Parquet file of patients")
+    score.add_argument("input", help="input file with the nine diagnosis columns")
+    score.add_argument("output", help="output CSV (row, crisp_score, disease, error)")
+    score.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    score.add_argument("--chunk-size", type=int, default=10000, help="rows per work unit")
+    score.add_argument("--backend", choices=sorted(engine.BACKENDS), default="numpy",
+                       help="engine backend (default: numpy)")
+    score.add_argument("--rulebase", help="rule-base spec (default: $FUZZY_RULEBASE or rulebase.json)")
+    score.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+
+    build = commands.add_parser("compile", help="compile the rule base into a memory-mappable engine artifact")
+    build.add_argument("output", help="artifact path (serve it with FUZZY_ARTIFACT=<path>)")
+    build.add_argument("--backend", choices=artifact.BACKENDS, default="analytic",
+                       help="engine backend (default: analytic)")
+    build.add_argument("--rulebase", help="rule-base spec (default: $FUZZY_RULEBASE or rulebase.json)")
+    build.add_argument("--resolution", type=int, help="samples per universe for the numpy backend")
+
+    args = parser.parse_args(argv)
+    if args.command == "score":
+        score_file(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                   backend=args.backend, rulebase_path=args.rulebase, resume=not args.no_resume)
+    elif args.command == "compile":
+        compiled = artifact.compile_artifact(args.output, args.backend, engine.load_rulebase(args.rulebase),
+                                             args.resolution)
+        print(f"Compiled rule base {compiled.version} ({compiled.fingerprint}) -> {args.output} "
+              f"({os.path.getsize(args.output):,} bytes)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,753 @@
+from numpy import linspace
+import numpy as np
+import hashlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from types import MappingProxyType
+
+# ==========================================
+# COMPILED FUZZY ENGINE
+# ==========================================
+# The universes, fuzzy sets, rule base and label ladder live in a versioned
+# JSON spec (rulebase.json by default, or $FUZZY_RULEBASE). The spec is
+# validated into a RuleBase and compiled into an engine exactly once per
+# process (once in the Gunicorn master when the app is preloaded), and
+# recompiled only when the file changes.
+
+# Request fields, in the order every engine's evaluate() takes them
+FIELDS = ("fever", "headache", "rrate", "cough", "sthroat", "flu", "vomit", "diarr", "oxygen")
+DEFAULT_RULEBASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rulebase.json")
+
+
+class RuleBaseError(ValueError):
+    """Raised when a rule-base spec is malformed."""
+
+
+def _check(condition, message):
+    if not condition:
+        raise RuleBaseError(message)
+
+
+def _check_trapezoid(where, params):
+    _check(isinstance(params, list) and len(params) == 5
+           and all(isinstance(p, (int, float)) and not isinstance(p, bool) for p in params),
+           f"{where}: expected [left end, left center, right center, right end, height]")
+    a, b, c, d, h = params
+    _check(a < b <= c < d, f"{where}: breakpoints must satisfy a < b <= c < d, got {params}")
+    _check(0 < h <= 1, f"{where}: height must be in (0, 1], got {h}")
+
+
+class RuleBase:
+    """
+    Validated, immutable rule-base spec.
+
+    inputs:   ((field, variable), ...) in FIELDS order
+    universes / sets: read-only {variable: (lo, hi)} / {variable: {set: (a, b, c, d, h)}}
+    rules:    ((((variable, set), ...), output set), ...)
+    labels:   ((lower bound, label), ...) ascending
+    """
+    __slots__ = ("version", "resolution", "inputs", "output", "universes", "sets",
+                 "rules", "labels", "inconclusive", "fingerprint")
+
+    def __init__(self, spec):
+        _check(isinstance(spec, dict), "Rule base spec must be a JSON object")
+        for key in ("version", "inputs", "output", "rules", "labels", "inconclusive"):
+            _check(key in spec, f"Rule base spec is missing {key!r}")
+        _check(isinstance(spec["version"], str) and spec["version"], "'version' must be a non-empty string")
+        resolution = spec.get("resolution", 500)
+        _check(isinstance(resolution, int) and resolution >= 2, "'resolution' must be an integer >= 2")
+
+        universes, sets = {}, {}
+        variables = list(spec["inputs"]) + [spec["output"]]
+        for var in variables:
+            _check(isinstance(var, dict) and {"name", "universe", "sets"} <= set(var),
+                   "Every input/output needs 'name', 'universe' and 'sets'")
+            name = var["name"]
+            _check(name not in universes, f"Variable {name!r} is defined twice")
+            lo, hi = var["universe"]
+            _check(lo < hi, f"{name}: universe must be [low, high] with low < high")
+            _check(isinstance(var["sets"], dict) and var["sets"], f"{name}: needs at least one fuzzy set")
+            for set_name, params in var["sets"].items():
+                _check_trapezoid(f"{name}.{set_name}", params)
+            universes[name] = (lo, hi)
+            sets[name] = {set_name: tuple(params) for set_name, params in var["sets"].items()}
+
+        inputs = tuple((var.get("field"), var["name"]) for var in spec["inputs"])
+        _check(tuple(field for field, _ in inputs) == FIELDS,
+               f"Inputs must map the request fields {list(FIELDS)} in that order")
+        output = spec["output"]["name"]
+
+        rules = []
+        for i, rule in enumerate(spec["rules"]):
+            _check(isinstance(rule, dict) and "if" in rule and "then" in rule,
+                   f"Rule {i + 1}: needs 'if' and 'then'")
+            _check(rule["if"], f"Rule {i + 1}: empty antecedent")
+            antecedent = []
+            for var, set_name in rule["if"]:
+                _check(var in sets and var != output, f"Rule {i + 1}: unknown input variable {var!r}")
+                _check(set_name in sets[var], f"Rule {i + 1}: {var} has no set {set_name!r}")
+                _check(var not in (v for v, _ in antecedent), f"Rule {i + 1}: {var} used twice")
+                antecedent.append((var, set_name))
+            _check(rule["then"] in sets[output], f"Rule {i + 1}: {output} has no set {rule['then']!r}")
+            rules.append((tuple(antecedent), rule["then"]))
+        _check(rules, "Rule base has no rules")
+
+        labels = tuple((lower, name) for lower, name in spec["labels"])
+        _check(labels and list(labels) == sorted(labels, key=lambda l: l[0]),
+               "'labels' must be a non-empty list of [lower bound, label] in ascending order")
+
+        values = {
+            "version": spec["version"], "resolution": resolution, "inputs": inputs,
+            "output": output, "universes": universes, "sets": sets, "rules": tuple(rules),
+            "labels": labels, "inconclusive": spec["inconclusive"],
+        }
+        # everything that determines a crisp score / label (the version is just a name)
+        content = {key: value for key, value in values.items() if key != "version"}
+        values["fingerprint"] = hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+        # read-only views, so nothing can change a set under an unchanged fingerprint
+        values["universes"] = MappingProxyType(universes)
+        values["sets"] = MappingProxyType({var: MappingProxyType(s) for var, s in sets.items()})
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleBase is immutable")
+
+    def spec(self):
+        """A fresh JSON spec (safe to edit) that validates back into an identical rule base."""
+        def variable(var):
+            lo, hi = self.universes[var]
+            return {"name": var, "universe": [lo, hi],
+                    "sets": {name: list(params) for name, params in self.sets[var].items()}}
+        return {
+            "version": self.version,
+            "resolution": self.resolution,
+            "inputs": [dict(variable(var), field=field) for field, var in self.inputs],
+            "output": variable(self.output),
+            "rules": [{"if": [list(term) for term in antecedent], "then": consequent}
+                      for antecedent, consequent in self.rules],
+            "labels": [list(label) for label in self.labels],
+            "inconclusive": self.inconclusive,
+        }
+
+    @property
+    def label_names(self):
+        """Every label classify() can return."""
+        return tuple(name for _, name in self.labels) + (self.inconclusive, "Unknown")
+
+    def classify(self, crisp_score):
+        """Clamp a raw centroid into the output universe and map it onto the label ladder."""
+        if np.isnan(crisp_score):
+            return 0.0, self.inconclusive
+
+        lo, hi = self.universes[self.output]
+        if crisp_score < lo: crisp_score = lo
+        if crisp_score > hi: crisp_score = hi
+
+        label = "Unknown"
+        for lower, name in self.labels:
+            if crisp_score >= lower:
+                label = name
+        return crisp_score, label
+
+
+def engine_fingerprint(rulebase, **options):
+    """Fingerprint of a compiled engine: its rule base plus any option that changes scores."""
+    if not options:
+        return rulebase.fingerprint
+    spec = json.dumps([rulebase.fingerprint, options], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def load_rulebase(path=None):
+    """Read and validate a rule-base spec (default: $FUZZY_RULEBASE or rulebase.json)."""
+    path = path or os.environ.get("FUZZY_RULEBASE", DEFAULT_RULEBASE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+    except ValueError as e:
+        raise RuleBaseError(f"{path} is not valid JSON: {e}")
+    try:
+        return RuleBase(spec)
+    except RuleBaseError as e:
+        raise RuleBaseError(f"{path}: {e}")
+    except (TypeError, KeyError, ValueError) as e:
+        raise RuleBaseError(f"{path}: malformed spec ({e!r})")
+
+
+# Universes, fuzzy sets and lookup arrays are immutable once built, so every
+# engine in the process (hot reloads, the model registry's side-by-side
+# versions) shares one copy of each distinct one. Entries vanish with the
+# last engine using them.
+_shared = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+def shared(key, factory):
+    """The process-wide object for `key`, built with factory() on first use."""
+    with _shared_lock:
+        value = _shared.get(key)
+        if value is None:
+            value = factory()
+            _shared[key] = value
+        return value
+
+
+def _universe(lo, hi, resolution):
+    def build():
+        domain = linspace(lo, hi, resolution)
+        domain.setflags(write=False)
+        return domain
+    return shared(("universe", lo, hi, resolution), build)
+
+
+def array_digest(array):
+    return hashlib.sha1(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def _shared_array(array, digest=None):
+    # identical content (e.g. an unchanged rule matrix in another version) -> one array.
+    # Arrays mapped from an artifact come with the digest recorded at build time
+    # and are only shared with other mapped arrays, so a view is never swapped
+    # for a heap copy.
+    if digest is None:
+        key = ("array", array.dtype.str, array.shape, array_digest(array))
+    else:
+        key = ("mapped", array.dtype.str, array.shape, digest)
+    return shared(key, lambda: array)
+
+
+class FuzzyEngine:
+    """
+    Immutable, compiled Mamdani system backed by pyit2fls.
+
+    Build it once and call evaluate() from as many requests as you like;
+    nothing on the instance is mutated after __init__.
+    """
+    __slots__ = ("_system", "_d_disease", "_names", "_explaining", "rulebase", "version", "fingerprint")
+
+    def __init__(self, rulebase=None, resolution=None):
+        # imported here so workers serving a compiled artifact never load pyit2fls
+        from pyit2fls import trapezoid_mf, T1FS, T1Mamdani
+
+        rulebase = rulebase or load_rulebase()
+        resolution = resolution or rulebase.resolution
+        universes = {name: (lo, hi, resolution) for name, (lo, hi) in rulebase.universes.items()}
+        domains = {name: _universe(*universe) for name, universe in universes.items()}
+
+        fuzzy_sets = {
+            (var, name): shared(("t1fs", universes[var], tuple(params)),
+                                lambda var=var, params=params: T1FS(domains[var], trapezoid_mf, params))
+            for var, sets in rulebase.sets.items()
+            for name, params in sets.items()
+        }
+
+        system = T1Mamdani()
+        for _, var in rulebase.inputs:
+            system.add_input_variable(var)
+        system.add_output_variable(rulebase.output)
+        for antecedent, consequent in rulebase.rules:
+            system.add_rule(
+                [(var, fuzzy_sets[(var, name)]) for var, name in antecedent],
+                [(rulebase.output, fuzzy_sets[(rulebase.output, consequent)])],
+            )
+
+        object.__setattr__(self, "_system", system)
+        object.__setattr__(self, "_d_disease", domains[rulebase.output])
+        object.__setattr__(self, "_names", tuple(var for _, var in rulebase.inputs))
+        # pyit2fls keeps its firing strengths and aggregated set to itself, so
+        # explain() runs the same system on the sampled numpy backend instead
+        object.__setattr__(self, "_explaining", NumpyEngine(rulebase, resolution=resolution))
+        object.__setattr__(self, "rulebase", rulebase)
+        object.__setattr__(self, "version", rulebase.version)
+        object.__setattr__(self, "fingerprint", engine_fingerprint(
+            rulebase, **({} if resolution == rulebase.resolution else {"resolution": resolution})))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FuzzyEngine is immutable")
+
+    def current(self):
+        return self
+
+    def evaluate(self, fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+        # Execution & Safe Defuzzification
+        _, tr = self._system.evaluate(dict(zip(self._names, (
+            fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen))))
+        return self.rulebase.classify(self._crisp_score(tr))
+
+    def _crisp_score(self, tr):
+        disease_out = tr.get(self.rulebase.output, 0.0)
+
+        if isinstance(disease_out, (int, float, np.float64, np.float32)):
+            crisp_score = float(disease_out)
+        elif hasattr(disease_out, 'mf'):
+            mf_values = np.array(disease_out.mf)
+            if np.sum(mf_values) == 0:
+                crisp_score = 0.0
+            else:
+                crisp_score = float(np.sum(self._d_disease * mf_values) / np.sum(mf_values))
+        else:
+            crisp_score = 0.0
+        return crisp_score
+
+    def explain(self, values, curve_points=0):
+        """
+        evaluate() plus an Explainer description; returns (score, label, explanation).
+
+        Score, label and explanation all come from one sampled NumpyEngine
+        evaluation at the same resolution, so they always agree with each
+        other; the score is within NUMPY_TOLERANCE of evaluate().
+        """
+        return self._explaining.explain(values, curve_points)
+
+    def evaluate_batch(self, patients):
+        """Score an (n, 9) array of patients; returns (scores, labels) lists."""
+        results = [self.evaluate(*row) for row in np.asarray(patients, dtype=float).tolist()]
+        return [score for score, _ in results], [label for _, label in results]
+
+
+# ==========================================
+# VECTORIZED NUMPY BACKEND
+# ==========================================
+# Same Mamdani system as FuzzyEngine (pyit2fls' default "Product" engine:
+# product t-norm for firing strength and implication, max aggregation, CoG
+# defuzzification by the trapezoidal rule), but evaluated for a whole batch
+# of patients at once with a (patients x rules x universe) layout instead of
+# one Python loop over the rules per patient.
+#
+# Tolerance: the centroid integrals use the same trapezoidal rule as
+# pyit2fls, so scores normally agree bit for bit. The documented guarantee is
+# NUMPY_TOLERANCE on crisp_score (reduction order inside numpy may differ
+# between versions); a label can only differ if a score sits within that
+# tolerance of a label boundary.
+#
+# defuzzification="analytic" skips the sampled output universe altogether.
+# With product implication each output set contributes a scaled trapezoid,
+# so the aggregated set is piecewise linear with kinks only at the sets'
+# breakpoints and where two overlapping scaled sets cross. Integrating
+# exactly between those points gives the true centroid; it differs from the
+# 500-sample result only by that sampling's discretization error (at most
+# ANALYTIC_TOLERANCE on the shipped rule base).
+NUMPY_TOLERANCE = 1e-9
+ANALYTIC_TOLERANCE = 1e-3
+DEFUZZIFICATION = ("sampled", "analytic")
+
+# numpy 2 renamed trapz to trapezoid
+_trapz = getattr(np, "trapezoid", None) or np.trapz
+
+
+def trapezoid(x, params):
+    """pyit2fls' trapezoid_mf, broadcasting over arrays of parameters."""
+    a, b, c, d, h = np.moveaxis(np.asarray(params, dtype=float), -1, 0)
+    return np.minimum(1, np.maximum(0, h * ((x - a) / (b - a)) * (x <= b)
+                                       + h * ((d - x) / (d - c)) * (x >= c)
+                                       + h * ((x > b) & (x < c))))
+
+
+class Explainer:
+    """
+    Why a patient got its score: the membership degree of every input in every
+    set and each rule's firing strength, from a single trapezoid call over
+    all input sets. Backends pass the firing strengths on to their own
+    aggregation, so explaining never runs inference a second time.
+    """
+    __slots__ = ("rulebase", "_columns", "_params", "_rule_sets", "_rule_mask")
+
+    def __init__(self, rulebase):
+        names = [var for _, var in rulebase.inputs]
+        index, columns, params = {}, [], []
+        for column, var in enumerate(names):
+            for name, set_params in rulebase.sets[var].items():
+                index[var, name] = len(params)
+                columns.append(column)
+                params.append(set_params)
+        width = max(len(antecedent) for antecedent, _ in rulebase.rules)
+        rule_sets = np.zeros((len(rulebase.rules), width), dtype=np.intp)
+        rule_mask = np.zeros((len(rulebase.rules), width), dtype=bool)
+        for r, (antecedent, _) in enumerate(rulebase.rules):
+            for k, key in enumerate(antecedent):
+                rule_sets[r, k] = index[key]
+                rule_mask[r, k] = True
+        self.rulebase = rulebase
+        self._columns = np.array(columns, dtype=np.intp)
+        self._params = np.array(params, dtype=float)
+        self._rule_sets = rule_sets
+        self._rule_mask = rule_mask
+
+    def memberships(self, values):
+        """Membership degree of the nine inputs (or an (n, 9) batch) in every input set, flattened."""
+        return trapezoid(np.asarray(values, dtype=float)[..., self._columns], self._params)
+
+    def firing_strengths(self, mu, rules=slice(None)):
+        """Product t-norm firing strengths from memberships(), for all or some rules."""
+        return np.prod(np.where(self._rule_mask[rules], mu[..., self._rule_sets[rules]], 1.0), axis=-1)
+
+    def input_sets(self, column):
+        """Indexes into memberships() of the sets over input `column`."""
+        return np.flatnonzero(self._columns == column)
+
+    def rules_reading(self, column):
+        """Indexes of the rules whose antecedent reads input `column`."""
+        return np.flatnonzero((np.isin(self._rule_sets, self.input_sets(column)) & self._rule_mask).any(axis=1))
+
+    def set_params(self, sets):
+        return self._params[sets]
+
+    def curve_domain(self, points):
+        return np.linspace(*self.rulebase.universes[self.rulebase.output], points)
+
+    def describe(self, mu, fired, curve=None):
+        """JSON-ready explanation; `curve` is an optional (x, membership) pair."""
+        rulebase, mu, fired = self.rulebase, mu.tolist(), fired.tolist()
+        degrees = iter(mu)
+        explanation = {
+            "memberships": {var: {name: next(degrees) for name in rulebase.sets[var]}
+                            for _, var in rulebase.inputs},
+            "rules": [{"rule": r + 1, "if": [list(term) for term in antecedent], "then": consequent,
+                       "strength": strength}
+                      for r, ((antecedent, consequent), strength) in enumerate(zip(rulebase.rules, fired))],
+        }
+        if curve is not None:
+            x, y = curve
+            explanation["curve"] = {"x": np.asarray(x).tolist(), "membership": np.asarray(y).tolist()}
+        return explanation
+
+
+def _analytic_layout(rulebase):
+    """Breakpoints, output-set parameters and possible crossings for exact integration."""
+    lo, hi = rulebase.universes[rulebase.output]
+    out_sets = list(rulebase.sets[rulebase.output].items())
+    params = np.array([p for _, p in out_sets], dtype=float)
+    # rule -> output set, so the strongest rule per set can be taken in one max
+    onehot = np.array([[name == set_name for set_name, _ in out_sets] for _, name in rulebase.rules], dtype=float)
+    points = sorted({lo, hi} | {p for ps in params for p in ps[:4] if lo < p < hi})
+
+    # on every elementary interval each set is linear; two sets that are both
+    # non-zero there may cross once, at a point that depends on the patient
+    crossings = []
+    for a, b in zip(points, points[1:]):
+        live = [k for k in range(len(params)) if trapezoid((a + b) / 2, params[k]) > 0]
+        for k, l in itertools.combinations(live, 2):
+            mk, ml = trapezoid(a, params[k]), trapezoid(a, params[l])
+            sk = (trapezoid(b, params[k]) - mk) / (b - a)
+            sl = (trapezoid(b, params[l]) - ml) / (b - a)
+            crossings.append((a, b - a, k, l, mk, sk, ml, sl))
+    crossings = np.array(crossings, dtype=float).reshape(-1, 8).T
+    return params, onehot, np.array(points, dtype=float), crossings
+
+
+class NumpyEngine:
+    """Immutable, vectorized Mamdani system that never calls into pyit2fls."""
+    __slots__ = ("_var_index", "_params", "_mask", "_consequents", "_d_disease", "_output_params",
+                 "_onehot", "_points", "_crossings", "_explainer", "chunk_size", "defuzzification",
+                 "rulebase", "version", "fingerprint")
+
+    def __init__(self, rulebase=None, chunk_size=1024, resolution=None, defuzzification="sampled"):
+        if defuzzification not in DEFUZZIFICATION:
+            raise ValueError(f"Unknown defuzzification {defuzzification!r}; choose from {DEFUZZIFICATION}")
+        rulebase = rulebase or load_rulebase()
+        resolution = resolution or rulebase.resolution
+        rules, sets, output = rulebase.rules, rulebase.sets, rulebase.output
+        names = [var for _, var in rulebase.inputs]
+        width = max(len(antecedent) for antecedent, _ in rules)
+        var_index = np.zeros((len(rules), width), dtype=np.intp)
+        # padding slots get a harmless dummy trapezoid and are masked to 1.0
+        params = np.tile(np.array([0, 1, 2, 3, 1], dtype=float), (len(rules), width, 1))
+        mask = np.zeros((len(rules), width), dtype=bool)
+        for r, (antecedent, _) in enumerate(rules):
+            for k, (var, name) in enumerate(antecedent):
+                var_index[r, k] = names.index(var)
+                params[r, k] = sets[var][name]
+                mask[r, k] = True
+
+        arrays = {"_var_index": var_index, "_params": params, "_mask": mask}
+        if defuzzification == "sampled":
+            # consequent membership of every rule sampled over the output universe
+            d_disease = _universe(*rulebase.universes[output], resolution)
+            arrays["_d_disease"] = d_disease
+            arrays["_consequents"] = trapezoid(
+                d_disease, np.array([sets[output][name] for _, name in rules])[:, None, :])
+        else:
+            layout = _analytic_layout(rulebase)
+            arrays.update(zip(("_output_params", "_onehot", "_points", "_crossings"), layout))
+        self._assign(rulebase, arrays, chunk_size, defuzzification)
+
+    @classmethod
+    def from_arrays(cls, rulebase, arrays, defuzzification="sampled", chunk_size=1024, digests=None):
+        """
+        Rebuild an engine from arrays() output, e.g. read-only views of a memory-mapped file.
+
+        `digests` ({name: array_digest()}, recorded when the arrays were
+        written) skips hashing them again and keeps the arrays as given.
+        """
+        if defuzzification not in DEFUZZIFICATION:
+            raise ValueError(f"Unknown defuzzification {defuzzification!r}; choose from {DEFUZZIFICATION}")
+        self = object.__new__(cls)
+        self._assign(rulebase, arrays, chunk_size, defuzzification, digests)
+        return self
+
+    def _assign(self, rulebase, arrays, chunk_size, defuzzification, digests=None):
+        if defuzzification == "sampled":
+            resolution = arrays["_d_disease"].size
+            options = {} if resolution == rulebase.resolution else {"resolution": resolution}
+        else:
+            options = {"defuzzification": defuzzification}
+        for name in self.__slots__:
+            value = arrays.get(name)
+            if value is not None:
+                if value.flags.writeable:
+                    value.setflags(write=False)
+                value = _shared_array(value, (digests or {}).get(name))
+            if name.startswith("_"):
+                object.__setattr__(self, name, value)
+        object.__setattr__(self, "_explainer", Explainer(rulebase))
+        object.__setattr__(self, "chunk_size", chunk_size)
+        object.__setattr__(self, "defuzzification", defuzzification)
+        object.__setattr__(self, "rulebase", rulebase)
+        object.__setattr__(self, "version", rulebase.version)
+        object.__setattr__(self, "fingerprint", engine_fingerprint(rulebase, **options))
+
+    def arrays(self):
+        """The compiled lookup arrays by slot name (what from_arrays() needs)."""
+        return {name: getattr(self, name) for name in self.__slots__
+                if name.startswith("_") and isinstance(getattr(self, name), np.ndarray)}
+
+    def __setattr__(self, name, value):
+        raise AttributeError("NumpyEngine is immutable")
+
+    def current(self):
+        return self
+
+    def firing_strengths(self, patients):
+        """(n, 9) crisp inputs -> (n, rules) firing strengths."""
+        values = patients[:, self._var_index]                  # (n, rules, width)
+        mu = np.where(self._mask, trapezoid(values, self._params), 1.0)
+        return np.prod(mu, axis=2)
+
+    def centroid_integrals(self, patients):
+        """(moment, area) of the aggregated output set for an (n, 9) batch."""
+        patients = np.atleast_2d(np.asarray(patients, dtype=float))
+        moments, areas = np.empty(len(patients)), np.empty(len(patients))
+        for start in range(0, len(patients), self.chunk_size):
+            chunk = patients[start:start + self.chunk_size]
+            stop = start + len(chunk)
+            moments[start:stop], areas[start:stop] = self.integrals(self.firing_strengths(chunk))
+        return moments, areas
+
+    def integrals(self, fired):
+        """(moment, area) of the aggregated output set for (n, rules) firing strengths."""
+        if self.defuzzification == "sampled":
+            return self._sampled_integrals(fired)
+        return self._analytic_integrals(fired)
+
+    def _sampled_integrals(self, fired):
+        aggregated = (fired[:, :, None] * self._consequents).max(axis=1)   # (n, universe)
+        return (_trapz(self._d_disease * aggregated, self._d_disease),
+                _trapz(aggregated, self._d_disease))
+
+    def _analytic_integrals(self, fired):
+        strength = (fired[:, :, None] * self._onehot).max(axis=1)          # (n, output sets)
+
+        # where two overlapping scaled sets cross inside their interval
+        a, width, k, l, mk, sk, ml, sl = self._crossings
+        k, l = k.astype(np.intp), l.astype(np.intp)
+        gk, gl = strength[:, k], strength[:, l]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = (gl * ml - gk * mk) / (gk * sk - gl * sl)
+        t = np.clip(np.nan_to_num(t, nan=0.0, posinf=0.0, neginf=0.0), 0, width)
+
+        y = np.concatenate([np.broadcast_to(self._points, (len(fired), len(self._points))), a + t], axis=1)
+        y.sort(axis=1)
+        g = (strength[:, None, :] * trapezoid(y[:, :, None], self._output_params)).max(axis=2)
+
+        # the aggregated set is linear between consecutive points: integrate exactly
+        dy, y0, y1, g0, g1 = np.diff(y, axis=1), y[:, :-1], y[:, 1:], g[:, :-1], g[:, 1:]
+        areas = np.sum(dy * (g0 + g1) / 2, axis=1)
+        moments = np.sum(dy * (y0 * (2 * g0 + g1) + y1 * (g0 + 2 * g1)) / 6, axis=1)
+        return moments, areas
+
+    def raw_scores(self, patients):
+        """Unclamped centroids for an (n, 9) batch; NaN where no rule fires."""
+        moments, areas = self.centroid_integrals(patients)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return moments / areas
+
+    def evaluate(self, fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+        raw = self.raw_scores([[fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen]])
+        return self.rulebase.classify(float(raw[0]))
+
+    def evaluate_batch(self, patients):
+        """Score an (n, 9) array of patients; returns (scores, labels) lists."""
+        results = [self.rulebase.classify(score) for score in self.raw_scores(patients).tolist()]
+        return [score for score, _ in results], [label for _, label in results]
+
+    def explain(self, values, curve_points=0):
+        """evaluate() plus an Explainer description; returns (score, label, explanation)."""
+        mu = self._explainer.memberships(values)
+        fired = self._explainer.firing_strengths(mu)[None, :]
+        moments, areas = self.integrals(fired)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score, label = self.rulebase.classify(float(moments[0] / areas[0]))
+        curve = None
+        if curve_points:
+            x = self._explainer.curve_domain(curve_points)
+            curve = (x, self.aggregated(fired, x)[0])
+        return score, label, self._explainer.describe(mu, fired[0], curve)
+
+    def aggregated(self, fired, x):
+        """Aggregated output membership at the points `x` for (n, rules) firing strengths."""
+        if self.defuzzification == "sampled":
+            sampled = (fired[:, :, None] * self._consequents).max(axis=1)
+            return np.array([np.interp(x, self._d_disease, row) for row in sampled])
+        strength = (fired[:, :, None] * self._onehot).max(axis=1)
+        return (strength[:, None, :] * trapezoid(np.asarray(x)[:, None], self._output_params)).max(axis=2)
+
+
+def _analytic_engine(rulebase=None, resolution=None):
+    # exact integration has no sampled universe, so `resolution` does not apply
+    return NumpyEngine(rulebase, defuzzification="analytic")
+
+
+def _lookup_engine(rulebase=None, resolution=None):
+    # imported lazily: building (or loading) the grid is only paid for on request;
+    # it tabulates the analytic backend, so `resolution` does not apply either
+    from lut import LookupEngine
+    return LookupEngine.load_or_build(rulebase)
+
+
+BACKENDS = {
+    "pyit2fls": FuzzyEngine,
+    "numpy": NumpyEngine,
+    "analytic": _analytic_engine,
+    "lut": _lookup_engine,
+}
+
+
+def build_engine(backend=None, rulebase=None, resolution=None):
+    """
+    Compile `rulebase` with `backend` (default: $FUZZY_ENGINE or pyit2fls).
+
+    `resolution` (default: $FUZZY_RESOLUTION, else the spec's) sets the
+    number of samples per universe for the sampled backends.
+    """
+    backend = backend or os.environ.get("FUZZY_ENGINE", "pyit2fls")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown fuzzy engine backend {backend!r}; choose from {sorted(BACKENDS)}")
+    if resolution is None and os.environ.get("FUZZY_RESOLUTION"):
+        resolution = int(os.environ["FUZZY_RESOLUTION"])
+    if resolution is not None and resolution < 2:
+        # one sample per universe leaves the centroid with nothing to integrate
+        raise ValueError(f"FUZZY_RESOLUTION must be at least 2 samples per universe, got {resolution}")
+    return BACKENDS[backend](rulebase or load_rulebase(), resolution=resolution)
+
+
+# ==========================================
+# HOT RELOAD
+# ==========================================
+class ReloadingEngine:
+    """
+    Keeps a compiled engine in sync with its rule-base file.
+
+    Callers take a snapshot with current() and run the whole request against
+    it, so swapping in a recompiled engine never affects in-flight requests.
+    The file's mtime is checked at most every `poll` seconds (0 disables
+    reloading). A changed file is recompiled on a background thread while
+    the previous engine keeps serving; a spec that fails validation is
+    logged and the previous engine stays.
+
+    With `artifact` (default: $FUZZY_ARTIFACT; False to ignore it) the engine
+    is memory-mapped from a compiled artifact (see artifact.py) instead of
+    compiled from the rule base, and reloaded whenever that file is rebuilt.
+    """
+
+    def __init__(self, path=None, backend=None, poll=None, artifact=None):
+        self.artifact = (os.environ.get("FUZZY_ARTIFACT") if artifact is None else artifact) or None
+        self.path = self.artifact or path or os.environ.get("FUZZY_RULEBASE", DEFAULT_RULEBASE)
+        self.backend = backend
+        self.poll = float(os.environ.get("FUZZY_RULEBASE_POLL", 2)) if poll is None else poll
+        self._lock = threading.Lock()
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._engine = self._build()
+        self._next_check = time.monotonic() + self.poll
+
+    def _build(self):
+        if self.artifact:
+            from artifact import load_artifact
+            return load_artifact(self.path)
+        return build_engine(self.backend, load_rulebase(self.path))
+
+    @property
+    def version(self):
+        return self._engine.version
+
+    @property
+    def fingerprint(self):
+        return self._engine.fingerprint
+
+    @property
+    def rulebase(self):
+        return self._engine.rulebase
+
+    def current(self):
+        if self.poll and time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        return self._engine
+
+    def _maybe_reload(self):
+        # only one thread notices a change; everyone keeps using the old engine
+        if not self._lock.acquire(blocking=False):
+            return
+        reloading = False
+        try:
+            self._next_check = time.monotonic() + self.poll
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                print(f"Rule base {self.path} unavailable, keeping version "
+                      f"{self._engine.version}: {e}", file=sys.stderr)
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            # compiling (a lookup table, a large resolution) can take a while:
+            # do it off the request path, holding the lock until it is swapped in
+            threading.Thread(target=self._reload, name="rulebase-reload", daemon=True).start()
+            reloading = True
+        finally:
+            if not reloading:
+                self._lock.release()
+
+    def _reload(self):
+        try:
+            try:
+                engine = self._build()
+            except (OSError, ValueError) as e:
+                print(f"Rejected rule base {self.path}, keeping version "
+                      f"{self._engine.version}: {e}", file=sys.stderr)
+                return
+            self._engine = engine
+            print(f"Loaded rule base version {engine.version} from {self.path}", file=sys.stderr)
+        finally:
+            self._lock.release()
+
+    def evaluate(self, *inputs):
+        return self.current().evaluate(*inputs)
+
+    def evaluate_batch(self, patients):
+        return self.current().evaluate_batch(patients)
+
+    def explain(self, values, curve_points=0):
+        return self.current().explain(values, curve_points)
+
+
+ENGINE = ReloadingEngine()
+
+
+def evaluate_disease_fuzzy(fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+    return ENGINE.evaluate(fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen)
@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import os
+
+# ==========================================
+# PRE-RENDERED, PRECOMPRESSED FRONTEND
+# ==========================================
+# The single-page UI has no per-request variables, so it is rendered once at
+# startup and kept as ready-to-send bytes in every encoding we offer: gzip
+# always, brotli when the optional `brotli` package is installed. Each hit
+# only picks a variant from Accept-Encoding and compares ETags.
+#
+#   FUZZY_PAGE_MAX_AGE  seconds browsers may reuse the page without asking
+#                       (default 300); after that they revalidate with
+#                       If-None-Match and get an empty 304 while it is unchanged
+#
+# ETags are strong and derived from the rendered bytes, so they change
+# exactly when a deploy changes the page; each encoding gets its own
+# ("<hash>-gzip"), as a strong validator must identify one representation.
+
+DEFAULT_MAX_AGE = 300
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _accepted(header):
+    """Accept-Encoding -> {coding: q}, lower-cased."""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class Page:
+    """One static response body with its precompressed variants and ETags."""
+
+    def __init__(self, body, content_type, max_age=DEFAULT_MAX_AGE):
+        if isinstance(body, str):
+            body = body.encode()
+        self.content_type = content_type
+        self.cache_control = f"public, max-age={max_age}"
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # most preferred first
+        self.variants = []
+        if brotli is not None:
+            self.variants.append(("br", brotli.compress(body, quality=BROTLI_QUALITY)))
+        self.variants.append(("gzip", gzip.compress(body, GZIP_LEVEL, mtime=0)))
+        self.variants.append(("identity", body))
+        self.etags = {coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+                      for coding, _ in self.variants}
+
+    def negotiate(self, accept_encoding):
+        """(coding, body) of the best variant the client accepts."""
+        accepted = _accepted(accept_encoding)
+        default = accepted.get("*", 0.0 if "*" in accepted else None)
+        best = None
+        for coding, body in self.variants:
+            q = accepted.get(coding, default)
+            if coding == "identity" and q is None:
+                q = 1.0     # identity is acceptable unless explicitly refused
+            if q and (best is None or q > best[0]):
+                best = (q, coding, body)
+        if best is None:
+            return "identity", self.variants[-1][1]
+        return best[1], best[2]
+
+    def not_modified(self, if_none_match):
+        """Whether If-None-Match names a current representation (weak comparison, per RFC 9110)."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return not tags.isdisjoint(self.etags.values())
+
+    def respond(self, accept_encoding=None, if_none_match=None):
+        """(status, body, headers) for one request; 304s carry no body."""
+        coding, body = self.negotiate(accept_encoding)
+        headers = [("ETag", self.etags[coding]), ("Cache-Control", self.cache_control),
+                   ("Vary", "Accept-Encoding")]
+        if self.not_modified(if_none_match):
+            return 304, b"", headers
+        headers.append(("Content-Type", self.content_type))
+        if coding != "identity":
+            headers.append(("Content-Encoding", coding))
+        return 200, body, headers
+
+
+def from_env(body, content_type="text/html; charset=utf-8"):
+    return Page(body, content_type, int(os.environ.get("FUZZY_PAGE_MAX_AGE", DEFAULT_MAX_AGE)))
@@ -0,0 +1,5 @@
+# Gunicorn settings for production (`gunicorn app:app` picks this file up automatically)
+
+# Import app.py (and therefore compile the fuzzy engine) once in the master
+# process, then fork workers that share it copy-on-write.
+preload_app = True
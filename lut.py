@@ -0,0 +1,283 @@
+import itertools
+import os
+import sys
+
+import numpy as np
+
+import engine
+
+# ==========================================
+# PRECOMPUTED LOOKUP-TABLE BACKEND
+# ==========================================
+# Only eight inputs are read by the rule base (SoreThroat never appears in an
+# antecedent) and three of those (flu, vomit, diarr) are booleans, so rule
+# firing strengths can be tabulated on a grid over the five continuous
+# inputs, with a 0/1 axis per boolean.
+#
+# Grid nodes sit on every trapezoid breakpoint, so inside a cell each input
+# set is linear in its input and each rule's strength, a product over
+# distinct inputs, is multilinear: multilinear interpolation reproduces it
+# exactly. The max over rules sharing a consequent (the height each output
+# set is scaled to) has kinks inside cells, so it is only taken after
+# interpolation, and the centroid is then integrated exactly as the analytic
+# backend does. Scores therefore match the analytic backend up to floating
+# point; the worst case is measured at load time and checked against
+# FUZZY_LUT_MAX_ERROR (default 1e-6) as a guard against a damaged table.
+#
+# Rows the grid does not cover fall back to the analytic engine: inputs
+# outside a universe, booleans other than exactly 0/1, inputs exactly on
+# the peak of a triangular set lower than 1, where the trapezoid spikes to
+# min(1, 2h) at a single point that the cells on either side must not see,
+# and rows where no rule fires above MIN_STRENGTH. The centroid does not
+# depend on the strengths' scale, so interpolation's rounding (~1e-16
+# absolute) would dominate strengths that small, e.g. an input one ulp
+# inside a set's support.
+#
+# Configure with FUZZY_LUT_PATH and FUZZY_LUT_MAX_ERROR.
+
+BOOLEAN_FIELDS = ("sthroat", "flu", "vomit", "diarr")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuzzy_lut.npz")
+DEFAULT_MAX_ERROR = 1e-6
+VALIDATION_SAMPLES = 20000
+MIN_STRENGTH = 1e-6         # weaker rows are scored by the exact engine
+
+
+def max_error_from_env():
+    return float(os.environ.get("FUZZY_LUT_MAX_ERROR", DEFAULT_MAX_ERROR))
+
+
+def _referenced_fields(rulebase):
+    used = {var for antecedent, _ in rulebase.rules for var, _ in antecedent}
+    return [(i, field, var) for i, (field, var) in enumerate(rulebase.inputs) if var in used]
+
+
+def _used_params(rulebase, var):
+    used = {name for antecedent, _ in rulebase.rules for v, name in antecedent if v == var}
+    return [rulebase.sets[var][name] for name in sorted(used)]
+
+
+def _axis_nodes(rulebase, var):
+    """Nodes for one continuous input: its universe bounds and every breakpoint of a set a rule reads."""
+    lo, hi = rulebase.universes[var]
+    return np.array(sorted({lo, hi} | {p for ps in _used_params(rulebase, var) for p in ps[:4] if lo < p < hi}),
+                    dtype=float)
+
+
+def _spikes(rulebase, var):
+    """Peaks of triangular sets lower than 1: the one point where a set is not continuous."""
+    return np.array(sorted({b for a, b, c, d, h in _used_params(rulebase, var) if b == c and h < 1}), dtype=float)
+
+
+def _membership(x, params):
+    """trapezoid() with the continuous value (h) at a triangle's peak instead of its min(1, 2h) spike."""
+    a, b, c, d, h = params
+    return np.where((x == b) & (b == c), h, engine.trapezoid(x, params))
+
+
+def _random_patients(rulebase, n, seed):
+    """Uniform patients over every universe with 0/1 booleans (the LUT's domain)."""
+    rng = np.random.default_rng(seed)
+    bounds = np.array([rulebase.universes[var] for _, var in rulebase.inputs], dtype=float)
+    patients = bounds[:, 0] + rng.random((n, len(bounds))) * (bounds[:, 1] - bounds[:, 0])
+    for i, field in enumerate(engine.FIELDS):
+        if field in BOOLEAN_FIELDS:
+            patients[:, i] = np.round(patients[:, i])
+    return patients
+
+
+class LookupEngine:
+    """Interpolated rule firing strengths, integrated exactly like the analytic backend."""
+
+    def __init__(self, axes, strengths, exact):
+        rulebase = exact.rulebase
+        fields = _referenced_fields(rulebase)
+        self._continuous = [(i, axes[field]) for i, field, _ in fields if field not in BOOLEAN_FIELDS]
+        self._booleans = [i for i, field, _ in fields if field in BOOLEAN_FIELDS]
+        self._bounds = [(i, *rulebase.universes[var]) for i, _, var in fields]
+        self._spikes = [(i, _spikes(rulebase, var)) for i, _, var in fields if len(_spikes(rulebase, var))]
+        self._strengths = strengths
+        # one row of rule strengths per grid point, so every corner is one gather
+        self._flat = strengths.reshape(-1, strengths.shape[-1])
+        strides = np.cumprod((strengths.shape[:-1] + (1,))[::-1])[::-1][1:]
+        self._strides = strides[:len(self._continuous)]
+        self._flag_strides = strides[len(self._continuous):]
+        self._corners = np.array([np.dot(bits, self._strides)
+                                  for bits in itertools.product((0, 1), repeat=len(self._continuous))])
+        self._exact = exact
+        self.axes = axes
+        self.rulebase = rulebase
+        self.version = rulebase.version
+        # the table's own scores may differ from the exact engine's in the last
+        # bits, so cached results are keyed apart; the exact engine's
+        # fingerprint only tells whether a saved table is stale
+        self.fingerprint = engine.engine_fingerprint(rulebase, backend="lut")
+        self.source_fingerprint = exact.fingerprint
+        self.measured_error = None
+        self.mean_error = None
+
+    # ---------- building / persistence ----------
+    @classmethod
+    def build(cls, exact):
+        """Tabulate every rule's firing strength for `exact` (an analytic NumpyEngine)."""
+        rulebase = exact.rulebase
+        fields = _referenced_fields(rulebase)
+        axes = {field: _axis_nodes(rulebase, var) for _, field, var in fields if field not in BOOLEAN_FIELDS}
+        axes.update({field: np.array([0.0, 1.0]) for _, field, _ in fields if field in BOOLEAN_FIELDS})
+
+        # every grid point as a full 9-input patient (unreferenced inputs stay 0)
+        ordered = [field for _, field, _ in fields if field not in BOOLEAN_FIELDS] + \
+                  [field for _, field, _ in fields if field in BOOLEAN_FIELDS]
+        shape = tuple(len(axes[field]) for field in ordered)
+        mesh = np.meshgrid(*(axes[field] for field in ordered), indexing="ij")
+        patients = np.zeros((int(np.prod(shape)), len(engine.FIELDS)))
+        for field, values in zip(ordered, mesh):
+            patients[:, engine.FIELDS.index(field)] = values.ravel()
+
+        columns = {var: i for i, (_, var) in enumerate(rulebase.inputs)}
+        strengths = np.ones((len(patients), len(rulebase.rules)))
+        for r, (antecedent, _) in enumerate(rulebase.rules):
+            for var, name in antecedent:
+                strengths[:, r] *= _membership(patients[:, columns[var]], rulebase.sets[var][name])
+        return cls(axes, strengths.reshape(shape + (len(rulebase.rules),)), exact)
+
+    @property
+    def size(self):
+        """Number of grid points."""
+        return len(self._flat)
+
+    def save(self, path):
+        """Write the grid to `path` atomically (workers may be loading it concurrently)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, strengths=self._strengths, fingerprint=self.source_fingerprint,
+                         **{f"axis_{field}": nodes for field, nodes in self.axes.items()})
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path, exact):
+        """Load a saved grid for `exact`'s rule base, or return None if it is missing, unreadable or stale."""
+        try:
+            with np.load(path) as data:
+                if str(data["fingerprint"]) != exact.fingerprint:
+                    return None
+                axes = {key[len("axis_"):]: data[key] for key in data.files if key.startswith("axis_")}
+                return cls(axes, data["strengths"], exact)
+        except Exception:
+            # truncated, corrupt or from an older layout (BadZipFile, KeyError, ...): rebuild it
+            return None
+
+    @classmethod
+    def load_or_build(cls, rulebase=None, path=None, max_error=None):
+        path = path or os.environ.get("FUZZY_LUT_PATH", DEFAULT_PATH)
+        max_error = max_error if max_error is not None else max_error_from_env()
+
+        exact = engine.NumpyEngine(rulebase, defuzzification="analytic")
+        lut = cls.load(path, exact)
+        if lut is None:
+            lut = cls.build(exact)
+            try:
+                lut.save(path)
+            except OSError as e:
+                print(f"Could not cache lookup table at {path}: {e}", file=sys.stderr)
+
+        error = lut.validate()
+        print(f"Lookup table: {lut.size} points, max |error| {error:.3g}, mean |error| "
+              f"{lut.mean_error:.3g} vs analytic engine (limit {max_error})", file=sys.stderr)
+        if error > max_error:
+            raise ValueError(f"Lookup table error {error:.3g} exceeds FUZZY_LUT_MAX_ERROR={max_error}; "
+                             f"delete {path} to rebuild it")
+        return lut
+
+    def validate(self, samples=VALIDATION_SAMPLES, seed=0):
+        """Max absolute raw-score error against the exact engine on a seeded sample."""
+        patients = _random_patients(self.rulebase, samples, seed)
+        exact = self._exact.raw_scores(patients)
+        approx = self.raw_scores(patients)
+        if (np.isnan(approx) != np.isnan(exact)).any():
+            # an inconclusive result where the exact engine has a score (or vice versa)
+            self.measured_error = self.mean_error = float("inf")
+            return self.measured_error
+        errors = np.abs(approx - exact)[~np.isnan(exact)]
+        self.measured_error = float(np.max(errors, initial=0.0))
+        self.mean_error = float(np.mean(errors)) if len(errors) else 0.0
+        return self.measured_error
+
+    # ---------- evaluation ----------
+    def covered(self, patients):
+        """Mask of the rows the grid scores; the rest fall back to the exact engine."""
+        return self._grid_scores(np.atleast_2d(np.asarray(patients, dtype=float)))[1]
+
+    def _in_domain(self, patients):
+        ok = np.ones(len(patients), dtype=bool)
+        for i, lo, hi in self._bounds:
+            ok &= (patients[:, i] >= lo) & (patients[:, i] <= hi)
+        for i in self._booleans:
+            ok &= (patients[:, i] == 0) | (patients[:, i] == 1)
+        for i, points in self._spikes:
+            ok &= ~np.isin(patients[:, i], points)
+        return ok
+
+    def firing_strengths(self, patients):
+        """(n, rules) firing strengths of covered() patients, interpolated from the grid."""
+        base = np.zeros(len(patients), dtype=np.intp)
+        fracs = np.empty((len(self._continuous), len(patients)))
+        for d, (i, nodes) in enumerate(self._continuous):
+            idx = np.clip(np.searchsorted(nodes, patients[:, i], side="right") - 1, 0, len(nodes) - 2)
+            base += idx * self._strides[d]
+            fracs[d] = (patients[:, i] - nodes[idx]) / (nodes[idx + 1] - nodes[idx])
+        for i, stride in zip(self._booleans, self._flag_strides):
+            base += patients[:, i].astype(np.intp) * stride
+
+        # multilinear interpolation: gather the 2^d cell corners, then lerp one axis at a time
+        fired = self._flat[base[:, None] + self._corners]
+        fired = fired.reshape((len(patients),) + (2,) * len(self._continuous) + (-1,))
+        for frac in fracs:
+            frac = frac.reshape((-1,) + (1,) * (fired.ndim - 2))
+            fired = fired[:, 0] + (fired[:, 1] - fired[:, 0]) * frac
+        return fired
+
+    def _grid_scores(self, patients):
+        """(scores, mask): centroids of the rows the grid covers, NaN elsewhere."""
+        ok = self._in_domain(patients)
+        scores = np.full(len(patients), np.nan)
+        inside = np.flatnonzero(ok)
+        for start in range(0, len(inside), self._exact.chunk_size):
+            rows = inside[start:start + self._exact.chunk_size]
+            fired = self.firing_strengths(patients[rows])
+            strongest = fired.max(axis=1)
+            # no rule firing at all is exact (an inconclusive NaN either way)
+            ok[rows[(strongest > 0) & (strongest < MIN_STRENGTH)]] = False
+            moments, areas = self._exact.integrals(fired)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                scores[rows] = moments / areas
+        return scores, ok
+
+    def raw_scores(self, patients):
+        patients = np.atleast_2d(np.asarray(patients, dtype=float))
+        scores, ok = self._grid_scores(patients)
+        if not ok.all():
+            scores[~ok] = self._exact.raw_scores(patients[~ok])
+        return scores
+
+    def current(self):
+        return self
+
+    def evaluate(self, fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+        raw = self.raw_scores([[fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen]])
+        return self.rulebase.classify(float(raw[0]))
+
+    def evaluate_batch(self, patients):
+        """Score an (n, 9) array of patients; returns (scores, labels) lists."""
+        results = [self.rulebase.classify(score) for score in self.raw_scores(patients).tolist()]
+        return [score for score, _ in results], [label for _, label in results]
+
+    def explain(self, values, curve_points=0):
+        # the grid only stores firing strengths, so explanations (and the
+        # score reported with them) come from the analytic engine it tabulates
+        return self._exact.explain(values, curve_points)
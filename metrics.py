@@ -0,0 +1,236 @@
+import atexit
+import bisect
+import cProfile
+import functools
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# ==========================================
+# REQUEST METRICS AND PROFILING HOOK
+# ==========================================
+# Counters and latency histograms for the API, exposed in the Prometheus text
+# format on /metrics.
+#
+#   FUZZY_METRICS      shared (default) | worker | off
+#   FUZZY_PROFILE_DIR  enables POST /api/profile and is where .prof files go
+#
+# "shared" keeps every series in one shared-memory block created before
+# Gunicorn forks its workers (preload_app), so /metrics reports the whole
+# server no matter which worker answers the scrape. "worker" keeps them per
+# process (e.g. for `flask run`).
+#
+# Hot-path cost is a few perf_counter() calls per request and one lock
+# acquisition when the request is recorded.
+#
+# The rule base is compiled once at startup, so per request the time splits
+# into parse (JSON body), evaluate (inference + defuzzification in the engine,
+# including cache lookups) and serialize (building the response), recorded
+# per endpoint and stage.
+
+ENDPOINTS = ("diagnose", "batch", "sweep", "monitor", "reports")
+STAGES = ("parse", "evaluate", "serialize")
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (help, label name(s), label value(s))
+COUNTERS = {
+    "fuzzy_requests_total": ("Requests handled", "endpoint", ENDPOINTS),
+    "fuzzy_request_errors_total": ("Requests answered with a 4xx/5xx error", "endpoint", ENDPOINTS),
+    "fuzzy_inconclusive_total": ("Patients diagnosed as Inconclusive", "endpoint", ENDPOINTS),
+    "fuzzy_batch_rows_total": ("Batch rows processed", "result", ("scored", "error")),
+    "fuzzy_shadow_total": ("Patients shadow-scored against the candidate rule base", "result",
+                           ("agree", "disagree", "dropped")),
+    "fuzzy_coalesced_total": ("Micro-batches and patients scored by the async server", "kind", ("batches", "patients")),
+    "fuzzy_reports_total": ("Handoff reports queued, rendered or failed", "result", ("queued", "rendered", "failed")),
+}
+HISTOGRAMS = {
+    "fuzzy_request_seconds": ("End-to-end request latency", "endpoint", ENDPOINTS),
+    "fuzzy_stage_seconds": ("Time spent per request stage", ("endpoint", "stage"),
+                            tuple(itertools.product(ENDPOINTS, STAGES))),
+}
+
+
+def _labels(label, value):
+    """'endpoint="diagnose"', or several comma-separated pairs for tuple labels."""
+    if isinstance(label, str):
+        label, value = (label,), (value,)
+    return ",".join(f'{name}="{v}"' for name, v in zip(label, value))
+
+
+class Metrics:
+    """Fixed set of counters and histograms stored in one flat float64 array."""
+
+    def __init__(self, storage="shared"):
+        self.enabled = storage != "off"
+        self._offsets = {}
+        size = 0
+        for name, (_, _, values) in COUNTERS.items():
+            for value in values:
+                self._offsets[name, value] = size
+                size += 1
+        for name, (_, _, values) in HISTOGRAMS.items():
+            for value in values:
+                # per-bucket counts (last one is +Inf), then sum, then count
+                self._offsets[name, value] = size
+                size += len(BUCKETS) + 3
+        self._profile_slot = size
+        size += 1
+
+        if storage == "shared":
+            self._shm = shared_memory.SharedMemory(create=True, size=size * 8)
+            self._owner = os.getpid()
+            atexit.register(self._release)
+            self._values = np.ndarray((size,), dtype=np.float64, buffer=self._shm.buf)
+            self._values.fill(0)
+            self._lock = multiprocessing.Lock()
+        else:
+            self._values = np.zeros(size)
+            self._lock = threading.Lock()
+
+    def _release(self):
+        self._values = None
+        self._shm.close()
+        if os.getpid() == self._owner:
+            self._shm.unlink()
+
+    def record(self, counts=(), timings=()):
+        """Add (series, amount) counts and (series, seconds) observations in one go."""
+        if not self.enabled:
+            return
+        values = self._values
+        with self._lock:
+            for key, amount in counts:
+                values[self._offsets[key]] += amount
+            for key, seconds in timings:
+                offset = self._offsets[key]
+                values[offset + bisect.bisect_left(BUCKETS, seconds)] += 1
+                values[offset + len(BUCKETS) + 1] += seconds
+                values[offset + len(BUCKETS) + 2] += 1
+
+    def timer(self, endpoint):
+        return RequestTimer(self, endpoint)
+
+    def render(self, info=None):
+        """Prometheus text exposition of every series; `info` adds a fuzzy_rulebase_info gauge."""
+        with self._lock:
+            values = self._values.copy()
+        lines = []
+        for name, (help_text, label, label_values) in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for value in label_values:
+                lines.append(f'{name}{{{_labels(label, value)}}} {values[self._offsets[name, value]]:g}')
+        for name, (help_text, label, label_values) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for value in label_values:
+                offset = self._offsets[name, value]
+                labels = _labels(label, value)
+                cumulative = np.cumsum(values[offset:offset + len(BUCKETS) + 1])
+                for bound, total in zip(BUCKETS + ("+Inf",), cumulative):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total:g}')
+                lines.append(f'{name}_sum{{{labels}}} {values[offset + len(BUCKETS) + 1]:.9g}')
+                lines.append(f'{name}_count{{{labels}}} {values[offset + len(BUCKETS) + 2]:g}')
+        if info:
+            labels = ",".join(f'{key}="{value}"' for key, value in info.items())
+            lines += ["# HELP fuzzy_rulebase_info Rule base served by this worker",
+                      "# TYPE fuzzy_rulebase_info gauge", f"fuzzy_rulebase_info{{{labels}}} 1"]
+        return "\n".join(lines) + "\n"
+
+    # ---------- runtime profiling ----------
+    # The number of requests still to profile lives in the metrics block, so
+    # one POST /api/profile reaches whichever workers pick up the next requests.
+    def request_profile(self, requests):
+        with self._lock:
+            self._values[self._profile_slot] = max(0, requests)
+
+    def profile_remaining(self):
+        return int(self._values[self._profile_slot])
+
+    def claim_profile(self):
+        if self._values[self._profile_slot] <= 0:   # unlocked fast path
+            return False
+        with self._lock:
+            if self._values[self._profile_slot] <= 0:
+                return False
+            self._values[self._profile_slot] -= 1
+            return True
+
+
+class RequestTimer:
+    """Collects stage laps and counts for one request, recorded on finish()."""
+    __slots__ = ("metrics", "endpoint", "started", "last", "timings", "counts")
+
+    def __init__(self, metrics, endpoint):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.started = self.last = time.perf_counter()
+        self.timings = []
+        self.counts = [(("fuzzy_requests_total", endpoint), 1)]
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stage(stage, now - self.last)
+        self.last = now
+
+    def stage(self, stage, seconds):
+        """Record `seconds` spent in `stage` of this endpoint (for stages not timed by lap())."""
+        self.timings.append((("fuzzy_stage_seconds", (self.endpoint, stage)), seconds))
+
+    def count(self, name, label, amount=1):
+        if amount:
+            self.counts.append(((name, label), amount))
+
+    def finish(self, error=False):
+        if error:
+            self.counts.append((("fuzzy_request_errors_total", self.endpoint), 1))
+        self.timings.append((("fuzzy_request_seconds", self.endpoint), time.perf_counter() - self.started))
+        self.metrics.record(self.counts, self.timings)
+
+
+_profilers = {}
+_profiler_pid = None
+
+
+def profiled(metrics, directory, endpoint):
+    """
+    View decorator: while a profile is requested, run the view under cProfile.
+
+    Each worker accumulates its profiled requests per endpoint and rewrites
+    <directory>/fuzzy-<endpoint>-<pid>.prof after every one (load with pstats).
+    """
+    def decorator(view):
+        if not directory:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            global _profiler_pid
+            if not metrics.claim_profile():
+                return view(*args, **kwargs)
+            if _profiler_pid != os.getpid():   # fresh profilers after a fork
+                _profilers.clear()
+                _profiler_pid = os.getpid()
+            profiler = _profilers.setdefault(endpoint, cProfile.Profile())
+            try:
+                return profiler.runcall(view, *args, **kwargs)
+            finally:
+                path = os.path.join(directory, f"fuzzy-{endpoint}-{os.getpid()}.prof")
+                try:
+                    profiler.dump_stats(path)
+                except OSError as e:
+                    # a broken profile directory must not fail the request
+                    print(f"Could not write profile {path}: {e}", file=sys.stderr)
+        return wrapper
+    return decorator
+
+
+def from_env():
+    storage = os.environ.get("FUZZY_METRICS", "shared")
+    if storage not in ("shared", "worker", "off"):
+        raise ValueError(f"Unknown FUZZY_METRICS storage {storage!r}; choose shared, worker or off")
+    return Metrics(storage)
@@ -0,0 +1,224 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import engine
+from schema import ValidationError, schema_for
+from sweep import vectorized
+
+# ==========================================
+# INCREMENTAL RE-EVALUATION FOR BEDSIDE MONITORS
+# ==========================================
+# Ward monitors push temperature, SpO2 and respiratory rate every few
+# seconds while the symptom inputs rarely change. A MonitorSessions tracker
+# keeps, per patient, the latest inputs, the membership degree of every
+# input set and every rule's firing strength. An update only recomputes the
+# memberships of the inputs that actually changed and the rules that read
+# them, and only patients whose firing strengths moved are defuzzified again,
+# all of them together in a single batched integral. Vitals drifting inside
+# the flat core of their fuzzy sets therefore cost no inference at all.
+#
+#   FUZZY_MONITOR_MIN_DELTA     score change that triggers an event (default 1.0)
+#   FUZZY_MONITOR_MAX_SESSIONS  sessions kept per process, LRU (default 10000)
+#
+# An event (new score and label) is emitted when a session opens, when the
+# label changes, or when the score has moved at least min_delta away from
+# the last emitted score. Sessions live in the process that received them: an
+# update carrying all nine fields (re)opens a session anywhere, so a feed can
+# always recover after being routed to another worker.
+#
+# Scoring uses the NumPy engine for the current rule base (see
+# sweep.vectorized); a rule-base reload recomputes every session's state
+# before the next update is applied, and each session's next update is
+# re-scored (and emits an event if that moves it) under the new rule base.
+
+DEFAULT_MIN_DELTA = 1.0
+DEFAULT_MAX_SESSIONS = 10000
+
+
+class MonitorSessions:
+    """
+    Per-patient incremental scoring for streams of partial input updates.
+
+    Session state is kept column-wise (one row per patient in the values,
+    memberships and firing-strength arrays), so each call recomputes the
+    changed memberships and rules of all its patients input by input.
+    """
+
+    def __init__(self, source, min_delta=DEFAULT_MIN_DELTA, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.source = source
+        self.min_delta = min_delta
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()      # patient id -> row, least recently updated first
+        self._free = []
+        self._values = np.zeros((0, len(engine.FIELDS)))
+        self._scores = np.zeros(0)      # last emitted score per row, NaN before the first event
+        self._labels = []
+        self._rulebase = None
+        self._stale = set()             # rows not yet re-scored since a rule-base reload
+
+    def _compiled(self):
+        current = vectorized(self.source.current())
+        # the lookup table stores no rule strengths; track its exact engine instead
+        current = getattr(current, "_exact", current)
+        if current.rulebase is not self._rulebase:
+            # first use or a rule-base reload: rebuild the layout and every session's state
+            explainer = engine.Explainer(current.rulebase)
+            self._layout = []
+            for column in range(len(engine.FIELDS)):
+                sets = explainer.input_sets(column)
+                self._layout.append((sets, explainer.set_params(sets), explainer.rules_reading(column)))
+            self._explainer = explainer
+            self._mu = explainer.memberships(self._values)
+            self._fired = explainer.firing_strengths(self._mu)
+            if self._rulebase is not None:
+                # every live score is from the old rule base: re-score each
+                # session on its next update even if its strengths did not move
+                self._stale = set(self._rows.values())
+            self._rulebase = current.rulebase
+        return current, self._explainer
+
+    def update(self, patient_id, record):
+        """Apply one update; returns its event dict, or None when nothing is emitted."""
+        events = self.update_many([(patient_id, record)])
+        if events and "error" in events[0]:
+            raise ValueError(events[0]["error"])
+        return events[0] if events else None
+
+    def update_many(self, updates):
+        """
+        Apply (patient_id, {field: value, ...}) updates in order.
+
+        Returns the emitted events, plus {"patient_id", "error"} entries for
+        updates that were rejected.
+        """
+        with self._lock:
+            current, explainer = self._compiled()
+            events = []
+            touched = {}        # row -> patient id
+            opened = set()
+            changed = {}        # row -> changed input columns
+            schema = schema_for(current.rulebase)
+            for patient_id, record in updates:
+                try:
+                    # same universe checks and FUZZY_VALIDATION policy as /api/diagnose
+                    values = schema.parse_fields(record)
+                    row = self._rows.get(patient_id)
+                    if row is None and len(values) < len(engine.FIELDS):
+                        raise ValueError(f"No session for patient {patient_id!r}; send all nine fields to open one")
+                except ValidationError as e:
+                    events.append({"patient_id": patient_id, "error": str(e), "fields": e.fields})
+                    continue
+                except ValueError as e:
+                    events.append({"patient_id": patient_id, "error": str(e)})
+                    continue
+
+                if row is None:
+                    row = self._open(patient_id, touched, opened, changed)
+                    self._values[row] = [values[i] for i in range(len(engine.FIELDS))]
+                    opened.add(row)
+                else:
+                    self._rows.move_to_end(patient_id)
+                    for column, value in values.items():
+                        if self._values[row, column] != value:
+                            self._values[row, column] = value
+                            changed.setdefault(row, set()).add(column)
+                touched[row] = patient_id
+
+            dirty = self._recompute(explainer, opened, changed)
+            dirty.update(self._stale.intersection(touched))
+            self._stale.difference_update(touched)
+            if dirty:
+                events += self._score(current, dirty, touched)
+        return events
+
+    def _open(self, patient_id, touched, opened, changed):
+        if len(self._rows) >= self.max_sessions:
+            _, row = self._rows.popitem(last=False)
+            self.evictions += 1
+            self._stale.discard(row)
+            # the evicted patient may have been updated earlier in this call
+            touched.pop(row, None)
+            opened.discard(row)
+            changed.pop(row, None)
+        elif self._free:
+            row = self._free.pop()
+        else:
+            size = len(self._values)
+            grown = min(self.max_sessions, max(64, 2 * size))
+            self._values = np.concatenate([self._values, np.zeros((grown - size, self._values.shape[1]))])
+            self._mu = np.concatenate([self._mu, np.zeros((grown - size, self._mu.shape[1]))])
+            self._fired = np.concatenate([self._fired, np.zeros((grown - size, self._fired.shape[1]))])
+            self._scores = np.concatenate([self._scores, np.full(grown - size, np.nan)])
+            self._labels += [None] * (grown - size)
+            self._free = list(range(grown - 1, size, -1))
+            row = size
+        self._rows[patient_id] = row
+        self._scores[row] = np.nan
+        return row
+
+    def _recompute(self, explainer, opened, changed):
+        """Refresh memberships and firing strengths; returns the rows whose strengths may have moved."""
+        dirty = set(opened)
+        if opened:
+            rows = sorted(opened)
+            self._mu[rows] = explainer.memberships(self._values[rows])
+            self._fired[rows] = explainer.firing_strengths(self._mu[rows])
+
+        by_column = [[] for _ in engine.FIELDS]
+        for row, columns in changed.items():
+            if row not in opened:
+                for column in columns:
+                    by_column[column].append(row)
+        # every membership first, then the rules reading them
+        for column, ((sets, params, _), rows) in enumerate(zip(self._layout, by_column)):
+            if rows:
+                self._mu[np.ix_(rows, sets)] = engine.trapezoid(self._values[rows, column][:, None], params)
+        for (_, _, rules), rows in zip(self._layout, by_column):
+            if rows and len(rules):
+                block = np.ix_(rows, rules)
+                fired = explainer.firing_strengths(self._mu[rows], rules)
+                # a vital moving inside the flat core of its sets changes nothing downstream
+                moved = (fired != self._fired[block]).any(axis=1)
+                self._fired[block] = fired
+                dirty.update(np.asarray(rows)[moved].tolist())
+        return dirty
+
+    def _score(self, current, dirty, touched):
+        rows = sorted(dirty)
+        moments, areas = current.integrals(self._fired[rows])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            raw = (moments / areas).tolist()
+        events = []
+        for row, value in zip(rows, raw):
+            score, label = current.rulebase.classify(value)
+            if label == self._labels[row] and abs(score - self._scores[row]) < self.min_delta:
+                continue
+            self._scores[row], self._labels[row] = score, label
+            events.append({"patient_id": touched[row], "crisp_score": score, "disease": label,
+                           "rulebase_version": current.version})
+        return events
+
+    def close(self, patient_id):
+        """Forget a patient; returns whether a session existed."""
+        with self._lock:
+            row = self._rows.pop(patient_id, None)
+            if row is None:
+                return False
+            self._free.append(row)
+            self._stale.discard(row)
+            return True
+
+    def stats(self):
+        return {"pid": os.getpid(), "sessions": len(self._rows), "capacity": self.max_sessions,
+                "evictions": self.evictions, "min_delta": self.min_delta}
+
+
+def from_env(source):
+    min_delta = float(os.environ.get("FUZZY_MONITOR_MIN_DELTA", DEFAULT_MIN_DELTA))
+    max_sessions = int(os.environ.get("FUZZY_MONITOR_MAX_SESSIONS", DEFAULT_MAX_SESSIONS))
+    return MonitorSessions(source, min_delta, max_sessions)
@@ -0,0 +1,267 @@
+from pyit2fls import trapezoid_mf, T1FS, T1Mamdani
+from numpy import linspace
+import numpy as np
+import sys
+
+from engine import (ANALYTIC_TOLERANCE, BACKENDS, DEFAULT_RULEBASE, FIELDS, NUMPY_TOLERANCE, NumpyEngine, RuleBase,
+                    load_rulebase)
+from monitor import MonitorSessions
+
+# ==========================================
+# PARITY CHECK: COMPILED ENGINE VS ORIGINAL
+# ==========================================
+# legacy_evaluate_disease_fuzzy() is a frozen copy of the original per-call
+# implementation from app.py. It rebuilds the whole system on every call and
+# is only kept here as the reference that the shipped rulebase.json, compiled
+# by every backend, is checked against.
+# Run with:  python parity.py [samples]
+
+def legacy_evaluate_disease_fuzzy(fever, headache, rrate, cough, sthroat, flu, vomit, diarr, oxygen):
+    # 1. Universes of Discourse (Fixed Medical Data)
+    d_fever = linspace(98, 104, 500)
+    d_headache = linspace(0, 10, 500)
+    d_rrate = linspace(10, 40, 500) 
+    d_cough = linspace(0, 10, 500)
+    d_sthroat = linspace(0, 1, 500)
+    d_flu = linspace(0, 1, 500)
+    d_vomit = linspace(0, 1, 500)
+    d_diarr = linspace(0, 1, 500)
+    d_oxygen = linspace(70, 100, 500) 
+    d_disease = linspace(0, 100, 500)
+
+    # 2. Fuzzy Sets
+    Fever_low = T1FS(d_fever, trapezoid_mf, [97.9, 98, 98.5, 99, 1])
+    Fever_med = T1FS(d_fever, trapezoid_mf, [98.5, 99, 101.5, 102, 1])
+    Fever_high = T1FS(d_fever, trapezoid_mf, [101.5, 102, 104, 104.1, 1])
+
+    Headache_mod = T1FS(d_headache, trapezoid_mf, [-0.1, 0, 4, 7, 1])
+    Headache_sev = T1FS(d_headache, trapezoid_mf, [4, 7, 10, 10.1, 1])
+
+    Rr_low = T1FS(d_rrate, trapezoid_mf, [9.9, 10, 16, 20, 1]) 
+    Rr_med = T1FS(d_rrate, trapezoid_mf, [16, 20, 25, 30, 1])  
+    Rr_high = T1FS(d_rrate, trapezoid_mf, [25, 30, 40, 40.1, 1]) 
+
+    Cough_low = T1FS(d_cough, trapezoid_mf, [-0.1, 0, 3.5, 5, 1])
+    Cough_high = T1FS(d_cough, trapezoid_mf, [4.5, 7, 10, 10.1, 1])
+
+    Sthroat_low = T1FS(d_sthroat, trapezoid_mf, [-0.1, 0, 0.2, 0.4, 1])
+    Sthroat_high = T1FS(d_sthroat, trapezoid_mf, [0.4, 0.6, 1, 1.1, 1])
+
+    Flu_no = T1FS(d_flu, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
+    Flu_yes = T1FS(d_flu, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
+
+    Vomit_no = T1FS(d_vomit, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
+    Vomit_yes = T1FS(d_vomit, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
+
+    Diarr_no = T1FS(d_diarr, trapezoid_mf, [-0.1, 0, 0.4, 0.5, 1])
+    Diarr_yes = T1FS(d_diarr, trapezoid_mf, [0.4, 0.5, 1, 1.1, 1])
+
+    Ox_low = T1FS(d_oxygen, trapezoid_mf, [69.9, 70, 85, 92, 1]) 
+    Ox_normal = T1FS(d_oxygen, trapezoid_mf, [90, 95, 100, 100.1, 1]) 
+
+    # RESTRUCTURED OUTPUT UNIVERSE
+    Di_normal = T1FS(d_disease, trapezoid_mf, [-0.1, 0, 10, 15, 1])
+    Di_viral = T1FS(d_disease, trapezoid_mf, [15, 20, 25, 30, 1]) 
+    Di_corona = T1FS(d_disease, trapezoid_mf, [30, 35, 45, 50, 1])
+    Di_pneumo = T1FS(d_disease, trapezoid_mf, [50, 55, 65, 70, 1])
+    Di_typhoid = T1FS(d_disease, trapezoid_mf, [70, 75, 80, 85, 1])
+    Di_malaria = T1FS(d_disease, trapezoid_mf, [85, 90, 100, 100.1, 1])
+
+    SYS = T1Mamdani()
+    SYS.add_input_variable("Fever")
+    SYS.add_input_variable("Headache")
+    SYS.add_input_variable("RespRate")
+    SYS.add_input_variable("Cough")
+    SYS.add_input_variable("SoreThroat")
+    SYS.add_input_variable("Flu")
+    SYS.add_input_variable("Vomit")
+    SYS.add_input_variable("Diarrhea")
+    SYS.add_input_variable("Oxygen") 
+    SYS.add_output_variable("Disease")
+
+    # ==========================================================
+    # 4. RULE BASE: 100% COVERAGE MATRIX & EXPERT SYSTEM
+    # ==========================================================
+    
+    # 1. Normal Oxygen Scenarios
+    SYS.add_rule([("Fever", Fever_low), ("Oxygen", Ox_normal)], [("Disease", Di_normal)])
+    SYS.add_rule([("Fever", Fever_med), ("Oxygen", Ox_normal), ("Diarrhea", Diarr_no), ("Vomit", Vomit_no)], [("Disease", Di_viral)])
+    SYS.add_rule([("Fever", Fever_high), ("Oxygen", Ox_normal), ("Diarrhea", Diarr_no), ("Vomit", Vomit_no)], [("Disease", Di_viral)])
+
+    # 2. Low Oxygen Scenarios (Critical Respiratory)
+    SYS.add_rule([("Fever", Fever_low), ("Oxygen", Ox_low)], [("Disease", Di_pneumo)])
+    SYS.add_rule([("Fever", Fever_med), ("Oxygen", Ox_low)], [("Disease", Di_pneumo)])
+    SYS.add_rule([("Fever", Fever_high), ("Oxygen", Ox_low)], [("Disease", Di_corona)])
+
+    # 3. SPECIFIC DISEASE TARGETING
+    SYS.add_rule([("RespRate", Rr_high), ("Cough", Cough_high), ("Oxygen", Ox_low), ("Flu", Flu_no)], [("Disease", Di_pneumo)])
+    SYS.add_rule([("Fever", Fever_high), ("Diarrhea", Diarr_yes), ("Headache", Headache_sev)], [("Disease", Di_typhoid)])
+    SYS.add_rule([("Fever", Fever_med), ("Vomit", Vomit_yes), ("Headache", Headache_sev), ("Oxygen", Ox_normal)], [("Disease", Di_malaria)])
+    SYS.add_rule([("Fever", Fever_high), ("Vomit", Vomit_yes), ("Oxygen", Ox_normal)], [("Disease", Di_malaria)])
+    SYS.add_rule([("Cough", Cough_high), ("Flu", Flu_yes), ("Oxygen", Ox_low)], [("Disease", Di_corona)])
+
+    # 5. Execution & Safe Defuzzification
+    _, tr = SYS.evaluate({
+        "Fever": fever, "Headache": headache, "RespRate": rrate, "Cough": cough,
+        "SoreThroat": sthroat, "Flu": flu, "Vomit": vomit, "Diarrhea": diarr, "Oxygen": oxygen
+    })
+
+    disease_out = tr.get("Disease", 0.0)
+    
+    if isinstance(disease_out, (int, float, np.float64, np.float32)):
+        crisp_score = float(disease_out)
+    elif hasattr(disease_out, 'mf'):
+        mf_values = np.array(disease_out.mf)
+        if np.sum(mf_values) == 0:
+            crisp_score = 0.0
+        else:
+            crisp_score = float(np.sum(d_disease * mf_values) / np.sum(mf_values))
+    else:
+        crisp_score = 0.0
+
+    if np.isnan(crisp_score):
+        return 0.0, "Inconclusive (Symptoms don't match clinical rules)"
+
+    if crisp_score < 0: crisp_score = 0
+    if crisp_score > 100: crisp_score = 100
+
+    if 0 <= crisp_score < 15: label = "Normal"
+    elif 15 <= crisp_score < 30: label = "General Viral / Flu"
+    elif 30 <= crisp_score < 50: label = "Coronavirus"
+    elif 50 <= crisp_score < 70: label = "Pneumonia"
+    elif 70 <= crisp_score < 85: label = "Typhoid"
+    elif 85 <= crisp_score <= 100: label = "Malaria"
+    else: label = "Unknown"
+
+    return crisp_score, label
+
+
+def breakpoints(rulebase):
+    """Per input column: every breakpoint and universe bound, plus one ulp either side, inside the universe."""
+    columns = []
+    for _, var in rulebase.inputs:
+        lo, hi = rulebase.universes[var]
+        points = {float(lo), float(hi)}
+        for a, b, c, d, _ in rulebase.sets[var].values():
+            points.update((a, b, c, d))
+        points = np.array(sorted(points), dtype=float)
+        points = np.concatenate([points, np.nextafter(points, -np.inf), np.nextafter(points, np.inf)])
+        columns.append(np.unique(points[(points >= lo) & (points <= hi)]))
+    return columns
+
+
+def sample_patients(n, seed=0, rulebase=None):
+    """Seeded patients spanning every universe; every fourth one sits on trapezoid breakpoints."""
+    rulebase = rulebase or load_rulebase(DEFAULT_RULEBASE)
+    rng = np.random.default_rng(seed)
+    bounds = np.array([rulebase.universes[var] for _, var in rulebase.inputs], dtype=float)
+    patients = bounds[:, 0] + rng.random((n, len(FIELDS))) * (bounds[:, 1] - bounds[:, 0])
+    # booleans are sent as 0/1 by the frontend
+    patients[:, 4:8] = np.round(patients[:, 4:8])
+    corners = slice(0, n, 4)
+    for column, points in enumerate(breakpoints(rulebase)):
+        patients[corners, column] = rng.choice(points, len(patients[corners]))
+    return patients
+
+
+# Allowed crisp_score deviation per backend; the pyit2fls backend must be exact.
+# A label may only differ when the expected score is within that tolerance of
+# a label boundary.
+TOLERANCES = {
+    "pyit2fls": 0.0,
+    "numpy": NUMPY_TOLERANCE,
+    "analytic": ANALYTIC_TOLERANCE,
+    "lut": ANALYTIC_TOLERANCE,
+}
+
+
+def _near_boundary(rulebase, score, tolerance):
+    return any(abs(score - lower) <= tolerance for lower, _ in rulebase.labels[1:])
+
+
+def check_parity(backend="pyit2fls", n=200, seed=0):
+    """Return a list of (inputs, expected, got) for every mismatching patient."""
+    rulebase = load_rulebase(DEFAULT_RULEBASE)
+    engine = BACKENDS[backend](rulebase)
+    tolerance = TOLERANCES[backend]
+    patients = sample_patients(n, seed, rulebase)
+    scores, labels = engine.evaluate_batch(patients)
+    mismatches = []
+    for row, score, label in zip(patients.tolist(), scores, labels):
+        expected = legacy_evaluate_disease_fuzzy(*row)
+        label_flip = label != expected[1] and not _near_boundary(rulebase, expected[0], tolerance)
+        if label_flip or abs(score - expected[0]) > tolerance:
+            mismatches.append((row, expected, (score, label)))
+    return mismatches
+
+
+class _Source:
+    """Stands in for a ReloadingEngine whose rule base can be swapped."""
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+
+    def current(self):
+        return self.compiled
+
+
+def check_monitor(n=200, seed=0):
+    """
+    Return (patient, expected, got) for every monitor session whose last
+    event disagrees with a full evaluation, before and after a rule-base
+    reload (the viral consequent moved up 5 points).
+    """
+    rulebase = load_rulebase(DEFAULT_RULEBASE)
+    source = _Source(NumpyEngine(rulebase))
+    sessions = MonitorSessions(source, min_delta=0.0, max_sessions=n)
+    patients = sample_patients(n, seed, rulebase)
+    last = {}
+
+    def send(updates):
+        for event in sessions.update_many(updates):
+            last[event["patient_id"]] = (event["crisp_score"], event["disease"])
+
+    def mismatches():
+        scores, labels = source.current().evaluate_batch(patients)
+        return [(i, (score, label), last.get(i)) for i, score, label in zip(range(n), scores, labels)
+                if last.get(i) is None or label != last[i][1] or abs(score - last[i][0]) > NUMPY_TOLERANCE]
+
+    send([(i, dict(zip(FIELDS, row))) for i, row in enumerate(patients.tolist())])
+    # vitals drift; sessions whose strengths do not move keep their last event
+    patients[:, 0] = np.clip(patients[:, 0] + 0.5, 98, 104)
+    send([(i, {"fever": row[0]}) for i, row in enumerate(patients.tolist())])
+    found = mismatches()
+
+    spec = rulebase.spec()
+    spec["version"] += "-reloaded"
+    spec["output"]["sets"]["viral"] = [p + 5 for p in spec["output"]["sets"]["viral"][:4]] + [1]
+    source.compiled = NumpyEngine(RuleBase(spec))
+    # an update that changes nothing must still re-score under the new rule base
+    send([(i, {"oxygen": row[8]}) for i, row in enumerate(patients.tolist())])
+    return found + mismatches()
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    failed = False
+    for backend in BACKENDS:
+        try:
+            mismatches = check_parity(backend, n)
+        except ValueError as e:
+            if backend != "lut":
+                raise
+            # the lookup table's startup guard refused it: that is a failure, not a pass
+            print(f"[{backend}] FAILED to build: {e}")
+            failed = True
+            continue
+        for args, expected, got in mismatches:
+            print(f"[{backend}] MISMATCH {args}: expected {expected}, got {got}")
+        print(f"[{backend}] {n - len(mismatches)}/{n} patients match the original engine "
+              f"(tolerance {TOLERANCES[backend]})")
+        failed = failed or bool(mismatches)
+    mismatches = check_monitor(n)
+    for patient, expected, got in mismatches:
+        print(f"[monitor] MISMATCH patient {patient}: expected {expected}, got {got}")
+    print(f"[monitor] {n - len(mismatches)}/{n} sessions match a full evaluation across a rule-base reload")
+    failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
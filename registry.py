@@ -0,0 +1,138 @@
+import json
+import os
+import queue
+import sys
+import threading
+import traceback
+
+import engine
+from cache import CachedEngine
+
+# ==========================================
+# MULTI-MODEL REGISTRY AND SHADOW SCORING
+# ==========================================
+# Serves several rule-base versions from one process so clinical rule
+# changes can be A/B tested without a second fleet.
+#
+#   FUZZY_MODELS        extra versions served next to the primary rule base:
+#                       comma-separated rule-base specs (.json) or compiled
+#                       artifacts (see artifact.py), each hot-reloaded
+#   FUZZY_SHADOW        version that shadow-scores every primary diagnosis
+#                       (/api/diagnose, /api/diagnose/batch and asgi.py)
+#   FUZZY_SHADOW_QUEUE  patients allowed to wait for shadow scoring (default
+#                       10000); beyond that they are dropped and counted
+#
+# A request picks a version with ?version=<version>; without it the primary
+# answers. Shadow scoring never touches the request path: the primary's
+# inputs and label are queued without blocking, and a background thread
+# scores them against the candidate in batches, counts agreements in
+# fuzzy_shadow_total and logs every label disagreement to stderr as one JSON
+# line.
+#
+# Versions share the result cache (keys carry each engine's fingerprint), and
+# engine.shared() gives them one copy of every identical universe, fuzzy set
+# and lookup array, so an extra version costs only what actually differs.
+
+DEFAULT_QUEUE_SIZE = 10000
+SHADOW_BATCH = 256
+
+
+class EngineRegistry:
+    """The primary engine plus candidate versions, resolved per request."""
+
+    def __init__(self, primary, candidates=(), shadow=None, metrics=None, queue_size=DEFAULT_QUEUE_SIZE):
+        self.primary = primary
+        self.candidates = list(candidates)
+        self.shadow = shadow
+        self.metrics = metrics
+        self.queue_size = queue_size
+        versions = self.versions()
+        if len(set(versions)) != len(versions):
+            raise ValueError(f"Every served rule base needs its own version, got {versions}")
+        if shadow is not None and shadow not in versions[1:]:
+            raise ValueError(f"FUZZY_SHADOW version {shadow!r} is not one of FUZZY_MODELS {versions[1:]}")
+        self._queue = None
+        self._worker_pid = None
+
+    def versions(self):
+        return [source.version for source in [self.primary] + self.candidates]
+
+    def resolve(self, version=None):
+        """Pinned engine for `version` (default: the primary); KeyError if none serves it."""
+        if version is None:
+            return self.primary.current()
+        for source in [self.primary] + self.candidates:
+            current = source.current()
+            if current.version == version:
+                return current
+        raise KeyError(version)
+
+    def observe(self, patients, labels, current):
+        """Queue patients the primary just scored for shadow scoring; never blocks."""
+        if self.shadow is None:
+            return
+        if self._worker_pid != os.getpid():
+            # one queue and thread per worker, started after Gunicorn forks
+            self._queue = queue.Queue(self.queue_size)
+            self._worker_pid = os.getpid()
+            threading.Thread(target=self._run, name="fuzzy-shadow", daemon=True).start()
+        try:
+            self._queue.put_nowait((patients, labels, current.version))
+        except queue.Full:
+            self._count("dropped", len(patients))
+
+    def _count(self, result, amount):
+        if self.metrics is not None and amount:
+            self.metrics.record([(("fuzzy_shadow_total", result), amount)])
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            rows = len(jobs[0][0])
+            while rows < SHADOW_BATCH:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                rows += len(jobs[-1][0])
+            try:
+                self._score(jobs)
+            except Exception:
+                traceback.print_exc()
+                self._count("dropped", rows)
+
+    def _score(self, jobs):
+        candidate = self.resolve(self.shadow)
+        patients = [row for rows, _, _ in jobs for row in rows]
+        primary = [(label, version) for _, labels, version in jobs for label in labels]
+        scores, labels = candidate.evaluate_batch(patients)
+        disagreements = 0
+        for row, (label, version), score, theirs in zip(patients, primary, scores, labels):
+            if label == theirs:
+                continue
+            disagreements += 1
+            print(json.dumps({
+                "event": "shadow_disagreement", "primary_version": version, "shadow_version": candidate.version,
+                "inputs": dict(zip(engine.FIELDS, row)), "primary_disease": label,
+                "shadow_disease": theirs, "shadow_score": score,
+            }), file=sys.stderr)
+        self._count("agree", len(patients) - disagreements)
+        self._count("disagree", disagreements)
+
+    def stats(self):
+        return {"primary": self.primary.version, "versions": self.versions(), "shadow": self.shadow}
+
+
+def from_env(primary, metrics=None):
+    """Registry around `primary` configured by FUZZY_MODELS / FUZZY_SHADOW*."""
+    candidates = []
+    for path in filter(None, (p.strip() for p in os.environ.get("FUZZY_MODELS", "").split(","))):
+        if path.endswith(".json"):
+            source = engine.ReloadingEngine(path, artifact=False)
+        else:
+            source = engine.ReloadingEngine(artifact=path)
+        if isinstance(primary, CachedEngine):
+            source = CachedEngine(source, primary.store, primary.quantize)
+        candidates.append(source)
+    queue_size = int(os.environ.get("FUZZY_SHADOW_QUEUE", DEFAULT_QUEUE_SIZE))
+    return EngineRegistry(primary, candidates, os.environ.get("FUZZY_SHADOW") or None, metrics, queue_size)
@@ -0,0 +1,386 @@
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ==========================================
+# SERVER-SIDE HANDOFF REPORTS
+# ==========================================
+# Renders the same clinical handoff report as the browser's generatePDF()
+# (demographics, vitals, symptoms, detected condition and crisp score) as a
+# one-page A4 PDF, written directly with the PDF base-14 Helvetica fonts: no
+# headless browser, no html2canvas, no extra dependency.
+#
+#   FUZZY_REPORT_WORKERS  rendering processes per server worker (default 2)
+#   FUZZY_REPORT_DIR      where finished jobs are kept (default <tmp>/fuzzy-reports)
+#   FUZZY_REPORT_TTL      seconds a finished job is kept (default 3600)
+#   FUZZY_REPORT_QUEUE    jobs allowed to wait for rendering per server worker
+#                         (default 64); beyond that submissions get a 503
+#
+# A job is scored in the request that submits it (one evaluate_batch call,
+# so every report matches what /api/diagnose answers) and then handed to a
+# process pool; rendering never holds the GIL of the process serving
+# /api/diagnose. Jobs live in FUZZY_REPORT_DIR as <job>.json (submitted),
+# <job>.zip (done) or <job>.error (failed), so any Gunicorn worker can answer
+# status and download requests for a job another worker accepted.
+#
+# The pool uses the spawn start method, which re-runs the server's __main__
+# script in every rendering process. Serve the app as an imported module
+# (gunicorn app:app, flask --app app run); `python app.py` hands itself over
+# to `flask run` for exactly that reason, so the rendering processes never
+# build a second engine, registry or cache.
+
+DEFAULT_WORKERS = 2
+DEFAULT_TTL = 3600
+DEFAULT_QUEUE_SIZE = 64
+MAX_REPORTS = 1000
+JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# ---------- minimal PDF writer ----------
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89          # A4 portrait, in points
+MARGIN = 40
+
+# Helvetica / Helvetica-Bold advance widths (1/1000 em) for ASCII 32-126, from the Adobe AFM files
+_WIDTHS = {
+    "F1": (278, 278, 355, 556, 556, 889, 667, 222, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556, 556,
+           556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778,
+           722, 278, 500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278,
+           278, 278, 469, 556, 222, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+           556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584),
+    "F2": (278, 333, 474, 556, 556, 889, 722, 278, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556, 556,
+           556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611, 975, 722, 722, 722, 722, 667, 611, 778,
+           722, 278, 556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333,
+           278, 333, 584, 556, 278, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+           611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584),
+}
+REGULAR, BOLD = "F1", "F2"
+
+
+def _rgb(color):
+    """'#rrggbb' -> 'r g b' operands."""
+    return " ".join(f"{int(color[i:i + 2], 16) / 255:.3f}" for i in (1, 3, 5))
+
+
+def _encode(text):
+    return str(text).encode("cp1252", "replace")
+
+
+def text_width(text, font, size):
+    widths = _WIDTHS[font]
+    return sum(widths[c - 32] if 32 <= c <= 126 else 556 for c in _encode(text)) * size / 1000
+
+
+class Canvas:
+    """Drawing operations for one page, with y measured from the top edge."""
+
+    def __init__(self):
+        self.ops = []
+
+    def rect(self, x, top, width, height, fill=None, stroke=None):
+        y = PAGE_HEIGHT - top - height
+        if fill:
+            self.ops.append(f"{_rgb(fill)} rg {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f")
+        if stroke:
+            self.ops.append(f"{_rgb(stroke)} RG 0.75 w {x:.2f} {y:.2f} {width:.2f} {height:.2f} re S")
+
+    def line(self, x1, x2, top, color):
+        y = PAGE_HEIGHT - top
+        self.ops.append(f"{_rgb(color)} RG 0.75 w {x1:.2f} {y:.2f} m {x2:.2f} {y:.2f} l S")
+
+    def text(self, x, baseline, text, font=REGULAR, size=10, color="#1e293b"):
+        escaped = _encode(text).replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+        self.ops.append(f"BT /{font} {size} Tf {_rgb(color)} rg {x:.2f} {PAGE_HEIGHT - baseline:.2f} Td (".encode()
+                        + escaped + b") Tj ET")
+        return x + text_width(text, font, size)
+
+    def centered(self, baseline, text, font=REGULAR, size=10, color="#1e293b"):
+        self.text((PAGE_WIDTH - text_width(text, font, size)) / 2, baseline, text, font, size, color)
+
+    def pdf(self):
+        """The page as a complete single-page PDF document."""
+        content = zlib.compress(b"\n".join(op if isinstance(op, bytes) else op.encode() for op in self.ops))
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+             f"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>").encode(),
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream",
+        ]
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+        return bytes(out)
+
+
+# ---------- the handoff report ----------
+def _number(value):
+    return f"{value:g}"
+
+
+def _yes_no(value):
+    # the form's symptom selects are No (0) / Yes (1)
+    return {0: "No", 1: "Yes"}.get(value, _number(value))
+
+
+def _panel(canvas, top, heading, groups):
+    """One grey section panel; `groups` is [(subheading, left rows, right rows)]. Returns the next top."""
+    canvas.text(MARGIN, top + 14, heading, BOLD, 13.5, "#334155")
+    top += 24
+    height = sum(36 + 21 * max(len(left), len(right)) for _, left, right in groups) + 8 * (len(groups) - 1) + 14
+    canvas.rect(MARGIN, top, PAGE_WIDTH - 2 * MARGIN, height, fill="#f8fafc", stroke="#e2e8f0")
+    y = top + 26
+    for n, (subheading, left, right) in enumerate(groups):
+        if n:
+            canvas.line(MARGIN + 15, PAGE_WIDTH - MARGIN - 15, y - 12, "#cbd5e1")
+            y += 8
+        canvas.text(MARGIN + 15, y, subheading, BOLD, 11.25, "#475569")
+        y += 22
+        for column, rows in ((MARGIN + 15, left), (PAGE_WIDTH / 2 + 5, right)):
+            for i, (label, value) in enumerate(rows):
+                x = canvas.text(column, y + 21 * i, f"{label}: ", BOLD, 10.5)
+                canvas.text(x, y + 21 * i, value, REGULAR, 10.5)
+        y += 21 * max(len(left), len(right)) + 14
+    return top + height + 22
+
+
+def render_report(report):
+    """
+    One handoff report as PDF bytes.
+
+    `report` holds the nine inputs (as scored), "crisp_score", "disease" and
+    the optional demographics "name", "age", "gender", "record_id" and "date".
+    """
+    canvas = Canvas()
+    inputs = report["inputs"]
+
+    canvas.rect(0, 0, PAGE_WIDTH, 78, fill="#2c3e50")
+    canvas.centered(38, "CLINICAL HANDOFF REPORT", BOLD, 21, "#ffffff")
+    canvas.centered(58, "AI Diagnostic Engine | Mamdani Fuzzy Inference System", REGULAR, 9, "#cbd5e1")
+    canvas.centered(120, "Clinical Triage Assessment", BOLD, 16.5, "#1e293b")
+
+    top = _panel(canvas, 140, "I. Patient Information", [
+        ("1. Demographics",
+         [("Patient Name", report.get("name") or "Not Provided"),
+          ("Age", report.get("age") or "Not Provided"),
+          ("Gender", report.get("gender") or "Not Specified")],
+         [("Assessment Date", report["date"]), ("Record ID", report["record_id"])]),
+    ])
+    top = _panel(canvas, top, "II. Current Status", [
+        ("1. Vital Signs",
+         [("Temperature", f"{_number(inputs['fever'])} °F"),
+          ("Respiratory Rate", f"{_number(inputs['rrate'])} breaths/min")],
+         [("Oxygen Saturation", f"{_number(inputs['oxygen'])} % SpO2")]),
+        ("2. Clinical Symptoms Evaluated",
+         [("Headache Severity", f"{_number(inputs['headache'])} / 10"),
+          ("Cough Severity", f"{_number(inputs['cough'])} / 10"),
+          ("Sore Throat", _yes_no(inputs["sthroat"]))],
+         [("Flu Symptoms", _yes_no(inputs["flu"])), ("Vomiting", _yes_no(inputs["vomit"])),
+          ("Diarrhea", _yes_no(inputs["diarr"]))]),
+    ])
+
+    canvas.text(MARGIN, top + 14, "III. AI Diagnostic Engine Assessment", BOLD, 13.5, "#334155")
+    top += 24
+    canvas.rect(MARGIN, top, PAGE_WIDTH - 2 * MARGIN, 74, fill="#f8fafc", stroke="#cbd5e1")
+    x = canvas.text(MARGIN + 19, top + 30, "Detected Condition: ", BOLD, 15)
+    canvas.text(x, top + 30, str(report["disease"]).upper(), BOLD, 15, "#dc2626")
+    x = canvas.text(MARGIN + 19, top + 56, "Crisp Risk Probability: ", BOLD, 12)
+    x = canvas.text(x, top + 56, f"{report['crisp_score']:.2f}", BOLD, 12, "#2563eb")
+    canvas.text(x, top + 56, " / 100.00", REGULAR, 12)
+
+    top += 74 + 38
+    canvas.line(MARGIN, PAGE_WIDTH - MARGIN, top, "#e2e8f0")
+    canvas.centered(top + 18, "* DISCLAIMER: This document is generated algorithmically via a Type-1 "
+                    "Mamdani Fuzzy Inference System.", REGULAR, 8, "#94a3b8")
+    canvas.centered(top + 30, "It is intended for academic and triage demonstration purposes only. "
+                    "Always consult a certified physician for final diagnosis. *", REGULAR, 8, "#94a3b8")
+    return canvas.pdf()
+
+
+def _filename(index, report):
+    record_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(report["record_id"]))[:64]
+    return f"{index + 1:04d}_Clinical_Handoff_Report_{record_id}.pdf"
+
+
+def render_job(directory, job_id, reports):
+    """Render every report of a job into <directory>/<job_id>.zip (runs in a pool process)."""
+    path = os.path.join(directory, job_id)
+    try:
+        with zipfile.ZipFile(path + ".zip.tmp", "w", zipfile.ZIP_STORED) as archive:
+            # the PDF content streams are already deflated
+            for index, report in enumerate(reports):
+                archive.writestr(_filename(index, report), render_report(report))
+        os.replace(path + ".zip.tmp", path + ".zip")
+    except Exception:
+        _write(path + ".error", traceback.format_exc().encode())
+        raise
+    return len(reports)
+
+
+def _write(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+# ---------- job queue ----------
+class QueueFull(RuntimeError):
+    """Raised when a worker already has FUZZY_REPORT_QUEUE jobs waiting."""
+
+
+class ReportQueue:
+    """Background rendering of report jobs into zip files on a process pool."""
+
+    def __init__(self, directory, workers=DEFAULT_WORKERS, ttl=DEFAULT_TTL, queue_size=DEFAULT_QUEUE_SIZE,
+                 metrics=None):
+        self.directory = directory
+        self.workers = workers
+        self.ttl = ttl
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._pending = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _pool(self):
+        if self._executor_pid != os.getpid():
+            # one pool per server worker, started after Gunicorn forks; spawned
+            # (not forked) so the children never inherit a threaded server
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, reports, version=None):
+        """Queue a job of scored reports; returns its job id, or raises QueueFull."""
+        if not reports:
+            raise ValueError("A report job needs at least one patient")
+        job_id = uuid.uuid4().hex
+        date = time.strftime("%d/%m/%Y, %H:%M:%S")
+        for report in reports:
+            report.setdefault("date", date)
+            if not report.get("record_id"):
+                report["record_id"] = f"AI-{uuid.uuid4().int % 1000000}"
+        self.prune()
+        with self._lock:
+            if self._pending >= self.queue_size:
+                raise QueueFull(f"{self._pending} report jobs are already waiting")
+            self._pending += 1
+        path = os.path.join(self.directory, job_id)
+        try:
+            _write(path + ".json", json.dumps({"job_id": job_id, "submitted": time.time(), "reports": len(reports),
+                                               "rulebase_version": version}).encode())
+            try:
+                future = self._pool().submit(render_job, self.directory, job_id, reports)
+            except BrokenProcessPool:
+                self._executor_pid = None
+                future = self._pool().submit(render_job, self.directory, job_id, reports)
+        except BaseException:
+            # the job never reached the pool: give its queue slot back
+            with self._lock:
+                self._pending -= 1
+            try:
+                os.remove(path + ".json")
+            except OSError:
+                pass
+            raise
+        future.add_done_callback(lambda done: self._finished(path, done, len(reports)))
+        self._count("queued", len(reports))
+        return job_id
+
+    def _finished(self, path, future, reports):
+        with self._lock:
+            self._pending -= 1
+        error = future.exception()
+        if error is None:
+            self._count("rendered", reports)
+            return
+        if isinstance(error, BrokenProcessPool):
+            # a pool process died: start a fresh pool for the next job
+            self._executor_pid = None
+        if not os.path.exists(path + ".error"):
+            _write(path + ".error", f"{type(error).__name__}: {error}".encode())
+        self._count("failed", reports)
+
+    def _count(self, result, amount):
+        if self.metrics is not None:
+            self.metrics.record([(("fuzzy_reports_total", result), amount)])
+
+    def prune(self):
+        """Delete jobs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            if JOB_ID.match(entry.name.split(".")[0]):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass        # another worker pruned it first
+
+    def status(self, job_id):
+        """The job's metadata plus "status" (pending | done | failed), or None if unknown."""
+        if not JOB_ID.match(job_id):
+            return None
+        path = os.path.join(self.directory, job_id)
+        try:
+            with open(path + ".json") as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        if os.path.exists(path + ".zip"):
+            job["status"] = "done"
+        elif os.path.exists(path + ".error"):
+            job["status"] = "failed"
+            with open(path + ".error", errors="replace") as f:
+                # the last traceback line names the exception; the file may be empty
+                lines = f.read().strip().splitlines()
+            job["error"] = lines[-1] if lines else "Report rendering failed"
+        else:
+            job["status"] = "pending"
+        return job
+
+    def archive(self, job_id):
+        """Path of the finished zip, or None while it is not ready."""
+        path = os.path.join(self.directory, job_id + ".zip")
+        return path if JOB_ID.match(job_id) and os.path.exists(path) else None
+
+    def report(self, job_id, index):
+        """One PDF out of a finished job (0-based index), or None."""
+        path = self.archive(job_id)
+        if path is None:
+            return None
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            if not 0 <= index < len(names):
+                return None
+            return archive.read(names[index])
+
+    def close(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._executor_pid = None
+
+
+def from_env(metrics=None):
+    directory = os.environ.get("FUZZY_REPORT_DIR") or os.path.join(tempfile.gettempdir(), "fuzzy-reports")
+    workers = int(os.environ.get("FUZZY_REPORT_WORKERS", DEFAULT_WORKERS))
+    ttl = float(os.environ.get("FUZZY_REPORT_TTL", DEFAULT_TTL))
+    queue_size = int(os.environ.get("FUZZY_REPORT_QUEUE", DEFAULT_QUEUE_SIZE))
+    return ReportQueue(directory, workers, ttl, queue_size, metrics)
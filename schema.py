@@ -0,0 +1,155 @@
+import functools
+import math
+import operator
+import os
+
+import numpy as np
+
+from engine import FIELDS
+
+# ==========================================
+# REQUEST SCHEMA
+# ==========================================
+# Every input is checked against its universe of discourse before any fuzzy
+# work starts, so missing keys, strings and impossible vitals come back as a
+# structured 400 instead of failing (or silently scoring Inconclusive) deep
+# inside the engine.
+#
+#   FUZZY_VALIDATION  reject (default) | clamp
+#
+# "reject" refuses values outside the universe (e.g. fever outside 98-104 or
+# oxygen outside 70-100); "clamp" moves them onto the nearest bound and scores
+# the patient. Non-numeric and non-finite values are always rejected.
+#
+# The schema is compiled once per rule base. Batches are checked column-wise:
+# the nine fields of a chunk are gathered with one itemgetter per record and
+# converted and range-checked as a single (n, 9) array; only rows that fail
+# take the slow path that explains what is wrong with them.
+
+POLICIES = ("reject", "clamp")
+
+
+class ValidationError(ValueError):
+    """Raised for an invalid patient; `fields` maps each bad field to its problem."""
+
+    def __init__(self, fields):
+        self.fields = fields
+        super().__init__("; ".join(f"{field}: {problem}" for field, problem in fields.items()))
+
+
+def parse_field(field, value):
+    """One input value as a finite float, or raise ValueError."""
+    if isinstance(value, bool):
+        value = int(value)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Field {field!r} is not a number: {value!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"Field {field!r} is not finite: {value!r}")
+    return value
+
+
+class RequestSchema:
+    """Field order, universe bounds and out-of-range policy for one rule base."""
+    __slots__ = ("lows", "highs", "policy", "_bounds", "_get")
+
+    def __init__(self, rulebase, policy="reject"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown FUZZY_VALIDATION policy {policy!r}; choose reject or clamp")
+        bounds = [rulebase.universes[var] for _, var in rulebase.inputs]
+        self.lows = np.array([lo for lo, _ in bounds], dtype=float)
+        self.highs = np.array([hi for _, hi in bounds], dtype=float)
+        self.policy = policy
+        self._bounds = [(field, float(lo), float(hi)) for field, (lo, hi) in zip(FIELDS, bounds)]
+        self._get = operator.itemgetter(*FIELDS)
+
+    def _value(self, field, lo, hi, value):
+        """One field's value under the policy, or raise ValueError naming the problem."""
+        if value is None or value == "":
+            raise ValueError("is required")
+        try:
+            value = parse_field(field, value)
+        except ValueError:
+            raise ValueError(f"must be a finite number, got {value!r}")
+        if not lo <= value <= hi:
+            if self.policy == "reject":
+                raise ValueError(f"must be between {lo:g} and {hi:g}, got {value:g}")
+            value = min(max(value, lo), hi)
+        return value
+
+    def parse(self, record):
+        """One record -> nine floats, clamped per the policy, or raise ValidationError."""
+        if not isinstance(record, dict):
+            raise ValidationError({"record": "must be a JSON object with the nine diagnosis fields"})
+        return list(self.parse_fields(record, partial=False).values())
+
+    def parse_fields(self, record, partial=True):
+        """
+        The diagnosis fields in `record` -> {column: value}, or raise ValidationError.
+
+        With `partial`, absent fields are skipped instead of required (e.g. a
+        monitor update carrying only the vitals that changed).
+        """
+        if not isinstance(record, dict):
+            raise ValidationError({"record": "must be a JSON object of diagnosis fields"})
+        problems, values = {}, {}
+        for column, (field, lo, hi) in enumerate(self._bounds):
+            if partial and field not in record:
+                continue
+            try:
+                values[column] = self._value(field, lo, hi, record.get(field))
+            except ValueError as e:
+                problems[field] = str(e)
+        if problems:
+            raise ValidationError(problems)
+        return values
+
+    def parse_many(self, records):
+        """
+        Records -> ((n, 9) float array, {row: ValidationError}).
+
+        Rows with errors hold NaN in the array.
+        """
+        gathered, failed = [], set()
+        for i, record in enumerate(records):
+            try:
+                gathered.append(self._get(record))
+            except (KeyError, TypeError):
+                gathered.append((np.nan,) * len(FIELDS))
+                failed.add(i)
+        try:
+            values = np.array(gathered, dtype=float).reshape(-1, len(FIELDS))
+        except (TypeError, ValueError):
+            # some value is not numeric: convert row by row to find which
+            values = np.full((len(gathered), len(FIELDS)), np.nan)
+            for i, row in enumerate(gathered):
+                try:
+                    values[i] = row
+                except (TypeError, ValueError):
+                    failed.add(i)
+
+        finite = np.isfinite(values).all(axis=1)
+        inside = ((values >= self.lows) & (values <= self.highs)).all(axis=1)
+        if self.policy == "clamp":
+            np.clip(values, self.lows, self.highs, out=values)
+            inside[:] = True
+        bad = failed.union(np.flatnonzero(~(finite & inside)).tolist())
+        errors = {}
+        for i in bad:
+            try:
+                values[i] = self.parse(records[i])
+            except ValidationError as e:
+                errors[i] = e
+                values[i] = np.nan
+        return values, errors
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(rulebase, policy):
+    return RequestSchema(rulebase, policy)
+
+
+def schema_for(rulebase, policy=None):
+    """The compiled schema for `rulebase` (policy default: $FUZZY_VALIDATION or reject)."""
+    return _compile(rulebase, policy or os.environ.get("FUZZY_VALIDATION", "reject"))
@@ -0,0 +1,99 @@
+import numpy as np
+
+import engine
+from schema import schema_for
+
+# ==========================================
+# SENSITIVITY / WHAT-IF SWEEPS
+# ==========================================
+# Hold a base patient fixed, vary one or two inputs over a range, and score
+# the whole grid with a single evaluate_batch() call:
+#
+#   sweep(engine, patient, [{"field": "oxygen", "start": 70, "stop": 100, "steps": 31}])
+#
+# returns the swept values per axis and crisp_score / disease surfaces shaped
+# (steps,) or (steps_1, steps_2), ready to plot. The base patient and the axes
+# are checked against the rule base's universes like /api/diagnose inputs.
+#
+# The pyit2fls backend scores a batch one patient at a time, so sweeps run on
+# an equivalent NumPy engine compiled from the same rule base (same
+# fingerprint, scores within NUMPY_TOLERANCE) instead.
+
+MAX_AXES = 2
+MAX_POINTS = 40000
+
+
+def parse_axes(axes, schema=None):
+    """
+    Validate sweep axes into [(column, field, values)], or raise ValueError.
+
+    With a `schema`, every axis must stay inside its input's universe (or is
+    clamped onto it, per the schema's policy).
+    """
+    if not isinstance(axes, list) or not 1 <= len(axes) <= MAX_AXES:
+        raise ValueError(f"'sweep' must be a list of 1 to {MAX_AXES} axes")
+    parsed, points = [], 1
+    for axis in axes:
+        if not isinstance(axis, dict) or not {"field", "start", "stop", "steps"} <= set(axis):
+            raise ValueError("Every sweep axis needs 'field', 'start', 'stop' and 'steps'")
+        field = axis["field"]
+        if field not in engine.FIELDS:
+            raise ValueError(f"Unknown sweep field {field!r}; choose from {list(engine.FIELDS)}")
+        if field in (f for _, f, _ in parsed):
+            raise ValueError(f"Field {field!r} is swept twice")
+        steps = axis["steps"]
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps < 2:
+            raise ValueError(f"{field}: 'steps' must be an integer >= 2")
+        try:
+            start, stop = float(axis["start"]), float(axis["stop"])
+        except (TypeError, ValueError):
+            raise ValueError(f"{field}: 'start' and 'stop' must be numbers")
+        if not (np.isfinite(start) and np.isfinite(stop)):
+            raise ValueError(f"{field}: 'start' and 'stop' must be finite")
+        column = engine.FIELDS.index(field)
+        if schema is not None:
+            lo, hi = schema.lows[column], schema.highs[column]
+            if not (lo <= start <= hi and lo <= stop <= hi):
+                if schema.policy == "reject":
+                    raise ValueError(f"{field}: 'start' and 'stop' must be between {lo:g} and {hi:g}")
+                start, stop = min(max(start, lo), hi), min(max(stop, lo), hi)
+        points *= steps
+        parsed.append((column, field, np.linspace(start, stop, steps)))
+    if points > MAX_POINTS:
+        raise ValueError(f"Sweep has {points} points; the limit is {MAX_POINTS}")
+    return parsed
+
+
+_vectorized = None
+
+
+def vectorized(current):
+    """`current`, or an equivalent NumPy engine when it is the per-patient pyit2fls backend."""
+    global _vectorized
+    if not isinstance(current, engine.FuzzyEngine):
+        return current
+    compiled = _vectorized
+    if compiled is None or compiled.fingerprint != current.fingerprint:
+        compiled = engine.NumpyEngine(current.rulebase, resolution=current._d_disease.size)
+        _vectorized = compiled
+    return compiled
+
+
+def sweep(current, patient, axes):
+    """Score `patient` over the grid spanned by `axes` in one batch."""
+    schema = schema_for(current.rulebase)
+    base = schema.parse(patient)
+    axes = parse_axes(axes, schema)
+    grids = np.meshgrid(*(values for _, _, values in axes), indexing="ij")
+    shape = grids[0].shape
+
+    patients = np.tile(np.array(base, dtype=float), (grids[0].size, 1))
+    for (column, _, _), grid in zip(axes, grids):
+        patients[:, column] = grid.ravel()
+    scores, labels = vectorized(current).evaluate_batch(patients)
+
+    return {
+        "axes": [{"field": field, "values": values.tolist()} for _, field, values in axes],
+        "crisp_score": np.array(scores, dtype=float).reshape(shape).tolist(),
+        "disease": np.array(labels, dtype=object).reshape(shape).tolist(),
+    }